@@ -1,56 +1,37 @@
 """
 Codes to test kb
+- stream = True prints the answer as it is generated (retrieve_and_generate_stream)
+  and reports time to first token next to the total latency
 """
 
-import boto3
-import json
-import os
 from botocore.exceptions import ClientError
+
+import bedrock_kb
 from credentials import aws_access_key_id, aws_secret_access_key, model_arn, knowledge_base_id
 
 # --- Config ---
 prompt = """
 질문 : 강아지 중성화 수술 시기는 언제가 적절해?
 """
+stream = True
+max_retries = 6    # throttling / transient errors, with backoff (bedrock_kb.call_with_retries)
 
 # --- Generate response ---
 # Create Amazon Bedrock Runtime client
-brt = boto3.client(
-    service_name="bedrock-agent-runtime",
-    region_name="ap-northeast-2",
-    aws_access_key_id=aws_access_key_id,
-    aws_secret_access_key=aws_secret_access_key
-)
-
+brt = bedrock_kb.create_client(aws_access_key_id, aws_secret_access_key)
 
+print("\n--- RESPONSE ---\n")
 try:
-    response = brt.retrieve_and_generate(
-    input={
-        'text': prompt
-    },
-    retrieveAndGenerateConfiguration={
-        'knowledgeBaseConfiguration': {
-            'knowledgeBaseId': knowledge_base_id ,  
-            'modelArn': model_arn,       
-            "orchestrationConfiguration": { 
-            "queryTransformationConfiguration": {
-                "type": "QUERY_DECOMPOSITION"
-            }},       
-            'generationConfiguration': {
-                'inferenceConfig': {
-                    'textInferenceConfig': {
-                        'maxTokens': 512,
-                        'temperature': 0,
-                        'topP': 0.9,
-                    }
-                }
-            }
+    # The client itself doesn't retry (max_attempts 1), call_with_retries does
+    response, attempts = bedrock_kb.call_with_retries(
+        bedrock_kb.answer, bedrock_kb.AdaptiveLimiter(1), max_retries,
+        client=brt, stream=stream, on_text=lambda chunk: print(chunk, end='', flush=True),
+        input={
+            'text': prompt
         },
-        'type': 'KNOWLEDGE_BASE'
-    },
-)
+        retrieveAndGenerateConfiguration=bedrock_kb.rag_configuration(knowledge_base_id, model_arn),
+    )
 
-    
 except (ClientError, Exception) as e:
     print(f"ERROR: {e}")
     exit(1)
@@ -58,26 +39,17 @@ except (ClientError, Exception) as e:
 
 # Decode the response body
 output_text = response['output']['text']
-print("\n--- RESPONSE ---\n")
-print(output_text)
+if not stream:
+    print(output_text)
+print(f"\n(ttft {response['ttft_sec']:.2f}s, total {response['latency_sec']:.2f}s, {len(output_text)} chars, "
+      f"{attempts} attempts)")
 
-citations = response.get('citations', [])
-if citations:
+refs = bedrock_kb.references(response.get('citations', []))
+if refs:
         print("\n--- SOURCE ---")
-        for citation in citations:
-            for reference in citation.get('retrievedReferences', []):
-                content_text = reference['content']['text']
-                location = reference['location']['s3Location']['uri']
-                
-                # Extract first number after first '\r'
-                first_r_index = content_text.find('\r')
-                if first_r_index != -1:
-                    after_first_r = content_text[first_r_index + 1:]
-                    # Find the first comma to get the start time
-                    comma_index = after_first_r.find(',')
-                    if comma_index != -1:
-                        start_time = after_first_r[:comma_index].strip()
-                        print(f"- [start_time]: {start_time}")
-                
-                content_preview = content_text[:50]
-                print(f"- [content]: {content_preview}...\n- [location]: {location}\n")
\ No newline at end of file
+        for ref in refs:
+            if ref['start_time']:
+                print(f"- [start_time]: {ref['start_time']}")
+
+            content_preview = ref['content_text'][:50]
+            print(f"- [content]: {content_preview}...\n- [location]: {ref['location']}\n")
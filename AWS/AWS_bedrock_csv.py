@@ -1,126 +1,334 @@
 """
 Codes to test kb and save results in csv format
+- questions run concurrently (--concurrency) behind an adaptive limiter:
+  throttling halves the allowed concurrency, successes ramp it back up
+- throttling and transient errors are retried with backoff
+- rows are written in question order as soon as every earlier question is done
+- --stream uses retrieve_and_generate_stream; every row records time to first token,
+  total latency and answer length (blocking calls have ttft == latency)
+- answers are cached in kb_cache.py; questions equal after normalization are asked once.
+  Rows answered from the cache or by an earlier duplicate have cached=1 and blank latencies
+- --resume appends only question numbers missing from an existing results csv
+- questions stream from JSONL / CSV (or a legacy Python list) in batches of batch_size
+- --shard-index/--shard-count split the questions by question number over several
+  processes or machines, each writing its own shard csv; `merge --shard-count N` combines
+  shards 0..N-1 into output_csv_path ordered by question number (all must exist)
+Pass any client with retrieve_and_generate(_stream) to run() (botocore Stubber works too);
+--fake runs against fake_bedrock.py instead of AWS
 """
 
-import boto3
-import json
 import os
+import sys
+import ast
 import csv
-from botocore.exceptions import ClientError
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import bedrock_kb
+import kb_cache
 from credentials import aws_access_key_id, aws_secret_access_key, model_arn, knowledge_base_id
 
 # --- Config ---
 prompt_template = "{}"
-questions_file_path = '/data2/jiyoon/Pethroom/data/dog_questions.py'  
-output_csv_path = '/data2/jiyoon/Pethroom/data/bedrock_results.csv' 
-
-
-# --- Generate response ---
-# Load questions 
-with open(questions_file_path, 'r', encoding='utf-8') as f:
-    questions = eval(f.read())
-
-# Create Amazon Bedrock Runtime client
-brt = boto3.client(
-    service_name="bedrock-agent-runtime",
-    region_name="ap-northeast-2",
-    aws_access_key_id=aws_access_key_id,
-    aws_secret_access_key=aws_secret_access_key
-)
-
-# Create CSV file
-csv_filename = output_csv_path
-with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-    fieldnames = ['question_number', 'question', 'output_text', 'start_time', 'content_text', 'location']
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-    writer.writeheader()
-
-    # Iterate through all questions
-    for i, question in enumerate(questions, 1):
-        print(f"\n{'='*60}")
-        print(f"Question {i}/{len(questions)}: {question}")
-        print(f"{'='*60}")
-        
-        prompt = prompt_template.format(question)
+questions_file_path = '/data2/jiyoon/Pethroom/data/dog_questions.py'
+output_csv_path = '/data2/jiyoon/Pethroom/data/bedrock_results.csv'
+concurrency = 8
+max_retries = 6
+stream = False
+batch_size = 1000            # questions in flight per thread pool round
+
+fieldnames = ['question_number', 'question', 'output_text', 'start_time', 'content_text', 'location',
+              'ttft_sec', 'latency_sec', 'output_chars', 'cached']
+
+
+# --- Utils ---
+def iter_questions(path=questions_file_path):
+    """
+    Yield (question_number, question) without loading the whole file
+    - .jsonl : {"question_number": 7, "question": "..."} or a bare JSON string per line
+    - .csv   : 'question' column, optional 'question_number' column
+    - .py    : legacy Python list literal (parsed with ast.literal_eval, never executed)
+    Numbers default to the 1-based position of the question in the file
+    """
+    if path.endswith('.py'):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from enumerate(ast.literal_eval(f.read()), 1)
+        return
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for position, record in enumerate(records, 1):
+            if isinstance(record, str):
+                yield position, record
+            else:
+                yield int(record.get('question_number') or position), record['question']
+
+
+def shard_questions(questions, shard_index, shard_count):
+    """Deterministic split: question n belongs to shard (n - 1) % shard_count"""
+    return ((number, question) for number, question in questions if (number - 1) % shard_count == shard_index)
+
+
+def shard_path(output_path, shard_index, shard_count):
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.shard-{shard_index}-of-{shard_count}{ext}"
+
+
+def merge_shards(output_path, shard_count):
+    """
+    Combine the shard csvs 0..shard_count-1 of output_path into it, ordered by question number
+    Shards of runs with another shard count are ignored; a missing shard raises FileNotFoundError
+    """
+    paths = [shard_path(output_path, i, shard_count) for i in range(shard_count)]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"missing shard files: {', '.join(missing)}")
+
+    header, rows = [], []
+    for path in paths:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            header += [name for name in reader.fieldnames or [] if name not in header]
+            rows += list(reader)
+    rows.sort(key=lambda row: int(row['question_number']))  # stable: references keep their order
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=header)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, output_path)
+    return len(paths)
+
+
+def answered_numbers(csv_path):
+    """Question numbers already in a results csv, and its header"""
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+        return set(), None
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        return {int(row['question_number']) for row in reader if row.get('question_number')}, reader.fieldnames
+
+
+def group_duplicates(questions):
+    """[(number, question)] -> [[(number, question), ...]] grouped by normalized question, first-seen order"""
+    groups = {}
+    for number, question in questions:
+        groups.setdefault(kb_cache.normalize_question(question), []).append((number, question))
+    return list(groups.values())
+
+
+def ask(client, limiter, question, streaming=False, on_text=None):
+    """
+    One blocking or streaming call (with retries) through the answer cache
+    Returns (response, attempts), attempts is 0 for a cache hit
+    """
+    config = bedrock_kb.rag_configuration(knowledge_base_id, model_arn)
+    cache = kb_cache.get_cache()
+    key = kb_cache.KBCache.make_key(question, prompt_template, config)
+    if not kb_cache.bypass:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, 0
+
+    response, attempts = bedrock_kb.call_with_retries(
+        bedrock_kb.answer, limiter, max_retries, client=client, stream=streaming, on_text=on_text,
+        input={'text': prompt_template.format(question)},
+        retrieveAndGenerateConfiguration=config,
+    )
+    cache.put(key, question, response)
+    return response, attempts
+
 
+def result_rows(number, question, response):
+    """CSV rows of one answer: one per reference, or a single row without citations"""
+    output_text = response['output']['text']
+    cached = response['latency_sec'] is None
+    metrics = {
+        'ttft_sec': '' if cached else round(response['ttft_sec'], 3),
+        'latency_sec': '' if cached else round(response['latency_sec'], 3),
+        'output_chars': len(output_text),
+        'cached': int(cached),
+    }
+    refs = bedrock_kb.references(response.get('citations', []))
+    if not refs:
+        refs = [{'start_time': '', 'content_text': '', 'location': ''}]
+    return [{'question_number': number, 'question': question, 'output_text': output_text, **ref, **metrics}
+            for ref in refs]
+
+
+def print_header(number, question):
+    print(f"\n{'='*60}")
+    print(f"Question {number}: {question}")
+    print(f"{'='*60}")
+    print("\n--- RESPONSE ---\n")
+
+
+def print_result(number, question, response, streamed=False):
+    """Print the answer and its sources; streamed answers were already printed chunk by chunk"""
+    if streamed:
+        print()
+    else:
+        print_header(number, question)
+        print(response['output']['text'])
+    if response['latency_sec'] is None:
+        print("\n(cached)")
+    else:
+        print(f"\n(ttft {response['ttft_sec']:.2f}s, total {response['latency_sec']:.2f}s)")
+
+    refs = bedrock_kb.references(response.get('citations', []))
+    if refs:
+        print("\n--- SOURCE ---")
+        for ref in refs:
+            if ref['start_time']:
+                print(f"- [start_time]: {ref['start_time']}")
+            print(f"- [content]: {ref['content_text'][:50]}...\n- [location]: {ref['location']}\n")
+
+
+def run(questions, client, writer, n_workers=concurrency, streaming=stream, limiter=None):
+    """
+    Ask every distinct (number, question) concurrently, write rows in question order
+    With one worker, streamed answers are echoed as they arrive
+    Returns the question numbers that failed after retries
+    """
+    limiter = limiter or bedrock_kb.AdaptiveLimiter(n_workers)
+    if streaming and n_workers == 1:
+        return run_echo(questions, client, writer, limiter)
+
+    order = [number for number, _ in questions]
+    done = {}
+    failed = []
+    next_index = 0
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(ask, client, limiter, group[0][1], streaming): group
+                   for group in group_duplicates(questions)}
+        for future in as_completed(futures):
+            group = futures[future]
+            (number, question), duplicates = group[0], group[1:]
+            try:
+                response, attempts = future.result()
+                print_result(number, question, response)
+                if duplicates:
+                    print(f"(same answer for questions {[n for n, _ in duplicates]})")
+                done[number] = result_rows(number, question, response)
+                for member_number, member_question in duplicates:
+                    done[member_number] = result_rows(member_number, member_question,
+                                                      kb_cache.as_cached(response))
+            except Exception as e:
+                print(f"ERROR: question {number}: {e}")
+                for member_number, _ in group:
+                    done[member_number] = []
+                    failed.append(member_number)
+
+            # Flush every finished question that no earlier one is waiting on
+            while next_index < len(order) and order[next_index] in done:
+                writer.writerows(done.pop(order[next_index]))
+                next_index += 1
+
+    return sorted(failed)
+
+
+def run_echo(questions, client, writer, limiter):
+    """One question at a time, printing text chunks as they stream in"""
+    failed = []
+    answered = {}
+    for number, question in questions:
+        print_header(number, question)
+        normalized = kb_cache.normalize_question(question)
         try:
-            response = brt.retrieve_and_generate(
-            input={
-                'text': prompt
-            },
-            retrieveAndGenerateConfiguration={
-                'knowledgeBaseConfiguration': {
-                    'knowledgeBaseId': knowledge_base_id ,  
-                    'modelArn': model_arn,       
-                    "orchestrationConfiguration": { 
-                    "queryTransformationConfiguration": {
-                        "type": "QUERY_DECOMPOSITION"
-                    }},       
-                    'generationConfiguration': {
-                        'inferenceConfig': {
-                            'textInferenceConfig': {
-                                'maxTokens': 512,
-                                'temperature': 0,
-                                'topP': 0.9,
-                            }
-                        }
-                    }
-                },
-                'type': 'KNOWLEDGE_BASE'
-            },
-        )
-
-            
-        except (ClientError, Exception) as e:
-            print(f"ERROR: {e}")
+            if normalized in answered:
+                response, attempts = kb_cache.as_cached(answered[normalized]), 0
+            else:
+                response, attempts = ask(client, limiter, question, True,
+                                         lambda chunk: print(chunk, end='', flush=True))
+        except Exception as e:
+            print(f"ERROR: question {number}: {e}")
+            failed.append(number)
             continue
+        answered[normalized] = response
+        if not attempts:
+            print(response['output']['text'], end='')
+        print_result(number, question, response, streamed=True)
+        writer.writerows(result_rows(number, question, response))
+    return failed
 
 
-        # Decode the response body
-        output_text = response['output']['text']
-        print("\n--- RESPONSE ---\n")
-        print(output_text)
-
-        citations = response.get('citations', [])
-        if citations:
-                print("\n--- SOURCE ---")
-                for citation in citations:
-                    for reference in citation.get('retrievedReferences', []):
-                        content_text = reference['content']['text']
-                        location = reference['location']['s3Location']['uri']
-                        
-                        # Extract first number after first '\r'
-                        start_time = ""
-                        first_r_index = content_text.find('\r')
-                        if first_r_index != -1:
-                            after_first_r = content_text[first_r_index + 1:]
-                            # Find the first comma to get the start time
-                            comma_index = after_first_r.find(',')
-                            if comma_index != -1:
-                                start_time = after_first_r[:comma_index].strip()
-                                print(f"- [start_time]: {start_time}")
-                        
-                        content_preview = content_text[:50]
-                        print(f"- [content]: {content_preview}...\n- [location]: {location}\n")
-                        
-                        # Write to CSV
-                        writer.writerow({
-                            'question_number': i,
-                            'question': question,
-                            'output_text': output_text,
-                            'start_time': start_time,
-                            'content_text': content_text,
-                            'location': location
-                        })
-        else:
-            # Write to CSV even if no citations
-            writer.writerow({
-                'question_number': i,
-                'question': question,
-                'output_text': output_text,
-                'start_time': '',
-                'content_text': '',
-                'location': ''
-            })
-
-print(f"\nResults saved to {csv_filename}")
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="Ask every question of the question set to the knowledge base")
+    parser.add_argument("command", choices=["run", "merge"], nargs="?", default="run")
+    parser.add_argument("--questions", default=questions_file_path, help="questions .jsonl, .csv or .py")
+    parser.add_argument("--concurrency", type=int, default=concurrency)
+    parser.add_argument("--output", default=output_csv_path)
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--shard-count", type=int, default=1)
+    parser.add_argument("--stream", action="store_true", default=stream,
+                        help="use the streaming API (answers are echoed live with --concurrency 1)")
+    parser.add_argument("--resume", action="store_true",
+                        help="append only questions missing from an existing output csv")
+    parser.add_argument("--fake", action="store_true", help="use fake_bedrock.py instead of AWS")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        if args.shard_count < 2:
+            parser.error("merge needs the --shard-count the shards were run with")
+        try:
+            count = merge_shards(args.output, args.shard_count)
+        except FileNotFoundError as e:
+            print(f"❌ Not merged, {e}")
+            sys.exit(1)
+        print(f"✅ Merged {count} shard files into {args.output}")
+        return
+
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be in [0, --shard-count)")
+
+    questions = iter_questions(args.questions)
+    output_path = args.output
+    if args.shard_count > 1:
+        questions = shard_questions(questions, args.shard_index, args.shard_count)
+        output_path = shard_path(args.output, args.shard_index, args.shard_count)
+
+    existing_header = None
+    if args.resume:
+        answered, existing_header = answered_numbers(output_path)
+        questions = ((number, question) for number, question in questions if number not in answered)
+        print(f"Resuming: {len(answered)} questions already answered")
+
+    if args.fake:
+        import fake_bedrock
+        client = fake_bedrock.FakeBedrockClient()
+    else:
+        client = bedrock_kb.create_client(aws_access_key_id, aws_secret_access_key, args.concurrency)
+    limiter = bedrock_kb.AdaptiveLimiter(args.concurrency)
+
+    start = time.time()
+    total, failed = 0, []
+    with open(output_path, 'a' if existing_header else 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=existing_header or fieldnames, extrasaction='ignore')
+        if not existing_header:
+            writer.writeheader()
+        while True:
+            batch = list(itertools.islice(questions, batch_size))
+            if not batch:
+                break
+            failed += run(batch, client, writer, args.concurrency, args.stream, limiter)
+            csvfile.flush()
+            total += len(batch)
+
+    print(f"\n{total - len(failed)}/{total} questions answered in {time.time() - start:.1f}s")
+    print(f"Concurrency limit ended at {limiter.limit:.1f}, {limiter.throttled} throttled calls")
+    if failed:
+        print(f"Failed questions: {failed}")
+    print(kb_cache.get_cache().stats())
+    print(f"Results saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
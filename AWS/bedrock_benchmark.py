@@ -0,0 +1,185 @@
+"""
+Latency / answer benchmark of knowledge base configurations
+- input : JSON config (see bedrock_benchmark.json) with the question set, trials, warm-up
+  and a matrix of rag_configuration settings (query_decomposition, number_of_results,
+  max_tokens, model_arn, ...); every combination is one cell
+- output : raw csv (one row per call) and summary csv per cell with p50/p95/p99 latency,
+  time to first token, citation counts and answer length distribution
+Warm-up calls of each cell are made but not recorded. --stub runs against fake_bedrock.py
+to test the harness offline.
+Usage: python bedrock_benchmark.py bedrock_benchmark.json [--stub]
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import bedrock_kb
+import AWS_bedrock_csv
+from credentials import aws_access_key_id, aws_secret_access_key, model_arn, knowledge_base_id
+
+# --- Config ---
+output_dir = '/data2/jiyoon/Pethroom/data/bedrock_benchmark'
+max_retries = 6
+
+
+# --- Utils ---
+def percentile(values, q):
+    """Linear interpolation percentile of a list, None when empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def matrix_cells(matrix, fixed=None):
+    """Every combination of the matrix values as rag_configuration keyword arguments"""
+    names = list(matrix)
+    cells = []
+    for values in itertools.product(*(matrix[name] for name in names)):
+        cell = dict(fixed or {}, **dict(zip(names, values)))
+        if cell.get('model_arn') in (None, 'default'):
+            cell['model_arn'] = model_arn
+        cells.append(cell)
+    return cells
+
+
+def cell_label(cell):
+    return ";".join(f"{k}={v}" for k, v in sorted(cell.items()))
+
+
+def measure(client, limiter, question, cell, streaming):
+    """One call of a cell, returns a raw result row (error filled on failure)"""
+    config = bedrock_kb.rag_configuration(knowledge_base_id, **cell)
+    try:
+        response, attempts = bedrock_kb.call_with_retries(
+            bedrock_kb.answer, limiter, max_retries, client=client, stream=streaming,
+            input={'text': AWS_bedrock_csv.prompt_template.format(question)},
+            retrieveAndGenerateConfiguration=config,
+        )
+    except Exception as e:
+        return {'attempts': '', 'ttft_sec': '', 'latency_sec': '', 'output_chars': '', 'citations': '',
+                'error': f"{type(e).__name__}: {e}"}
+    refs = bedrock_kb.references(response.get('citations', []))
+    return {
+        'attempts': attempts,
+        'ttft_sec': round(response['ttft_sec'], 4),
+        'latency_sec': round(response['latency_sec'], 4),
+        'output_chars': len(response['output']['text']),
+        'citations': len(refs),
+        'error': '',
+    }
+
+
+def run_cell(client, cell, questions, settings):
+    """Warm-up calls, then trials x questions; returns raw rows"""
+    limiter = bedrock_kb.AdaptiveLimiter(settings['concurrency'])
+    streaming = settings['stream']
+    with ThreadPoolExecutor(max_workers=settings['concurrency']) as executor:
+        warmup = [q for _, q in questions[:settings['warmup']]]
+        list(executor.map(lambda q: measure(client, limiter, q, cell, streaming), warmup))
+
+        jobs = [(trial, number, question) for trial in range(1, settings['trials'] + 1)
+                for number, question in questions]
+        results = executor.map(lambda job: measure(client, limiter, job[2], cell, streaming), jobs)
+        return [
+            {'cell': cell_label(cell), 'trial': trial, 'question_number': number, **result}
+            for (trial, number, _), result in zip(jobs, results)
+        ]
+
+
+def summarize(label, rows):
+    ok = [r for r in rows if not r['error']]
+    latencies = [r['latency_sec'] for r in ok]
+    ttfts = [r['ttft_sec'] for r in ok]
+    lengths = [r['output_chars'] for r in ok]
+    citations = [r['citations'] for r in ok]
+
+    def rounded(value, digits=3):
+        return None if value is None else round(value, digits)
+
+    return {
+        'cell': label,
+        'calls': len(rows),
+        'errors': len(rows) - len(ok),
+        'latency_p50': rounded(percentile(latencies, 50)),
+        'latency_p95': rounded(percentile(latencies, 95)),
+        'latency_p99': rounded(percentile(latencies, 99)),
+        'ttft_p50': rounded(percentile(ttfts, 50)),
+        'ttft_p95': rounded(percentile(ttfts, 95)),
+        'citations_mean': rounded(sum(citations) / len(citations) if citations else None, 2),
+        'citations_min': min(citations, default=None),
+        'citations_max': max(citations, default=None),
+        'chars_p5': rounded(percentile(lengths, 5), 1),
+        'chars_p50': rounded(percentile(lengths, 50), 1),
+        'chars_p95': rounded(percentile(lengths, 95), 1),
+        'retries': sum(r['attempts'] - 1 for r in ok),
+    }
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a matrix of knowledge base configurations")
+    parser.add_argument("config", help="JSON benchmark config")
+    parser.add_argument("--stub", action="store_true", help="use fake_bedrock.py instead of AWS")
+    parser.add_argument("--output-dir", default=output_dir)
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    settings = {
+        'trials': config.get('trials', 3),
+        'warmup': config.get('warmup', 3),
+        'concurrency': config.get('concurrency', 1),
+        'stream': config.get('stream', False),
+    }
+
+    questions = AWS_bedrock_csv.iter_questions(config.get('questions_path', AWS_bedrock_csv.questions_file_path))
+    questions = list(itertools.islice(questions, config.get('max_questions')))
+    cells = matrix_cells(config['matrix'], config.get('fixed'))
+
+    if args.stub:
+        import fake_bedrock
+        client = fake_bedrock.FakeBedrockClient()
+    else:
+        client = bedrock_kb.create_client(aws_access_key_id, aws_secret_access_key, settings['concurrency'])
+
+    print(f"{len(cells)} cells x {len(questions)} questions x {settings['trials']} trials "
+          f"(+{settings['warmup']} warm-up calls per cell)")
+
+    raw_rows, summary_rows = [], []
+    for i, cell in enumerate(cells, 1):
+        label = cell_label(cell)
+        start = time.time()
+        rows = run_cell(client, cell, questions, settings)
+        raw_rows += rows
+        summary = summarize(label, rows)
+        summary_rows.append(summary)
+        print(f"[{i}/{len(cells)}] {label}: p50 {summary['latency_p50']}s, p95 {summary['latency_p95']}s, "
+              f"p99 {summary['latency_p99']}s, {summary['errors']} errors ({time.time() - start:.1f}s)")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    raw_path = os.path.join(args.output_dir, f"raw_{stamp}.csv")
+    summary_path = os.path.join(args.output_dir, f"summary_{stamp}.csv")
+    write_csv(raw_path, raw_rows)
+    write_csv(summary_path, summary_rows)
+    print(f"\nRaw results saved to {raw_path}")
+    print(f"Summary saved to {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Shared pieces of the Bedrock knowledge base scripts
+- client creation (botocore retries off, so throttling reaches our own limiter)
+- retrieve_and_generate request configuration
+- blocking or streaming answers, both returned in the retrieve_and_generate shape
+  plus time-to-first-token / total latency
+- citations -> (content_text, location, start_time) references
+- adaptive concurrency limiter + retry with backoff for throttling / transient errors
+"""
+
+import time
+import random
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, BotoCoreError, EndpointConnectionError, ReadTimeoutError, ConnectionClosedError
+
+# --- Config ---
+region_name = "ap-northeast-2"
+backoff_base_sec = 1.0
+backoff_max_sec = 30.0
+
+# Event stream errors arrive as throttlingException etc., error_code() capitalizes them
+retryable_codes = {
+    'ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException',
+    'InternalServerException', 'ServiceUnavailableException', 'DependencyFailedException',
+    'BadGatewayException',
+}
+throttling_codes = {'ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException'}
+
+
+def create_client(aws_access_key_id, aws_secret_access_key, max_connections=10):
+    """bedrock-agent-runtime client with a connection pool sized for the thread pool"""
+    return boto3.client(
+        service_name="bedrock-agent-runtime",
+        region_name=region_name,
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        config=Config(max_pool_connections=max_connections, retries={'max_attempts': 1, 'mode': 'standard'}),
+    )
+
+
+def rag_configuration(knowledge_base_id, model_arn, query_decomposition=True, number_of_results=None,
+                      max_tokens=512, temperature=0, top_p=0.9):
+    """retrieveAndGenerateConfiguration for a knowledge base query"""
+    kb_config = {
+        'knowledgeBaseId': knowledge_base_id,
+        'modelArn': model_arn,
+        'generationConfiguration': {
+            'inferenceConfig': {
+                'textInferenceConfig': {
+                    'maxTokens': max_tokens,
+                    'temperature': temperature,
+                    'topP': top_p,
+                }
+            }
+        }
+    }
+    if query_decomposition:
+        kb_config['orchestrationConfiguration'] = {
+            'queryTransformationConfiguration': {'type': 'QUERY_DECOMPOSITION'}
+        }
+    if number_of_results:
+        kb_config['retrievalConfiguration'] = {
+            'vectorSearchConfiguration': {'numberOfResults': number_of_results}
+        }
+    return {'knowledgeBaseConfiguration': kb_config, 'type': 'KNOWLEDGE_BASE'}
+
+
+def extract_start_time(content_text):
+    """First number after the first '\\r' (up to the first comma), '' if there is none"""
+    first_r_index = content_text.find('\r')
+    if first_r_index == -1:
+        return ""
+    after_first_r = content_text[first_r_index + 1:]
+    comma_index = after_first_r.find(',')
+    if comma_index == -1:
+        return ""
+    return after_first_r[:comma_index].strip()
+
+
+def references(citations):
+    """[{'content_text', 'location', 'start_time'}] of every retrieved reference"""
+    refs = []
+    for citation in citations:
+        for reference in citation.get('retrievedReferences', []):
+            content_text = reference['content']['text']
+            refs.append({
+                'content_text': content_text,
+                'location': reference['location']['s3Location']['uri'],
+                'start_time': extract_start_time(content_text),
+            })
+    return refs
+
+
+def answer(client, stream=False, on_text=None, **kwargs):
+    """
+    Blocking or streaming retrieve_and_generate, consumed to the end
+    Returns {'output': {'text'}, 'citations', 'ttft_sec', 'latency_sec'}; without streaming the
+    first token is only visible with the full answer, so ttft_sec == latency_sec
+    on_text(chunk) is called for every streamed text chunk as it arrives
+    """
+    start = time.perf_counter()
+    if not stream:
+        response = client.retrieve_and_generate(**kwargs)
+        latency = time.perf_counter() - start
+        response['ttft_sec'] = response['latency_sec'] = latency
+        return response
+
+    response = client.retrieve_and_generate_stream(**kwargs)
+    chunks, citations, ttft = [], [], None
+    for event in response['stream']:
+        if 'output' in event:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(event['output']['text'])
+            if on_text:
+                on_text(event['output']['text'])
+        elif 'citation' in event:
+            citation = event['citation']
+            refs = citation.get('retrievedReferences') or citation.get('citation', {}).get('retrievedReferences', [])
+            citations.append({'generatedResponsePart': citation.get('generatedResponsePart', {}),
+                              'retrievedReferences': refs})
+
+    latency = time.perf_counter() - start
+    return {
+        'sessionId': response.get('sessionId'),
+        'output': {'text': "".join(chunks)},
+        'citations': citations,
+        'ttft_sec': latency if ttft is None else ttft,
+        'latency_sec': latency,
+    }
+
+
+def error_code(error):
+    """Error code of a ClientError, stream errors normalized to ThrottlingException etc."""
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code', '')
+        return code[:1].upper() + code[1:]
+    return ''
+
+
+def is_throttling(error):
+    return error_code(error) in throttling_codes
+
+
+def is_retryable(error):
+    if isinstance(error, ClientError):
+        return error_code(error) in retryable_codes
+    return isinstance(error, (EndpointConnectionError, ReadTimeoutError, ConnectionClosedError))
+
+
+def backoff_delay(attempt):
+    """Full jitter exponential backoff"""
+    return random.uniform(0, min(backoff_max_sec, backoff_base_sec * 2 ** attempt))
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit shared by all worker threads
+    - throttling halves the limit (at most once per cooldown, so a burst of 429s counts once)
+    - every success adds 1/limit, i.e. about +1 per round of requests
+    """
+
+    def __init__(self, max_concurrency, min_concurrency=1, cooldown_sec=1.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.cooldown_sec = cooldown_sec
+        self.limit = float(max_concurrency)
+        self.active = 0
+        self.last_decrease = 0.0
+        self.throttled = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= int(self.limit):
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.active -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+                if now - self.last_decrease >= self.cooldown_sec:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+def call_with_retries(fn, limiter, max_retries=6, **kwargs):
+    """
+    fn(**kwargs) inside the limiter, retrying throttling / transient errors
+    Returns (response, attempts); the last error is raised when retries run out
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        throttled = False
+        try:
+            return fn(**kwargs), attempt + 1
+        except (ClientError, BotoCoreError) as e:
+            throttled = is_throttling(e)
+            if attempt == max_retries or not is_retryable(e):
+                raise
+        finally:
+            # Any error (a bad stream event, an unwrapped transport error) must free the slot
+            limiter.release(throttled=throttled)
+        time.sleep(backoff_delay(attempt))
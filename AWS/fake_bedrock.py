@@ -0,0 +1,104 @@
+"""
+In-process stand-in for the bedrock-agent-runtime client
+- retrieve_and_generate answers after `latency` seconds with canned citations
+- retrieve_and_generate_stream yields the same answer as an event stream: the first text
+  chunk after `first_chunk_latency`, then one chunk every `chunk_interval` and the citation
+- more than `quota` calls in flight raise ThrottlingException, like a Bedrock quota
+- `error_rate` of calls raise InternalServerException
+Pass it anywhere a boto3 client is expected (--fake in AWS_bedrock_csv.py)
+"""
+
+import time
+import random
+import threading
+
+from botocore.exceptions import ClientError
+
+# --- Config ---
+latency = 1.0
+first_chunk_latency = 0.3
+chunk_interval = 0.05
+chunk_chars = 8
+quota = 4
+error_rate = 0.0
+references_per_answer = 2
+
+
+def client_error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+def fake_reference(question, n):
+    """Chunk text in the subtitle layout the real KB returns: header, then '\\r<start>,<end>,<text>' lines"""
+    start = 30.0 * (n + 1)
+    text = f"start,end,text\r{start},{start + 5.0},{question} 관련 설명 {n}\r{start + 5.0},{start + 9.0},이어지는 내용"
+    return {
+        'content': {'text': text},
+        'location': {'type': 'S3', 's3Location': {'uri': f"s3://fake-kb/chunks/video{n}/{start}_챕터.txt"}},
+    }
+
+
+class FakeBedrockClient:
+    def __init__(self, latency=latency, quota=quota, error_rate=error_rate, seed=None,
+                 first_chunk_latency=first_chunk_latency, chunk_interval=chunk_interval):
+        self.latency = latency
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_interval = chunk_interval
+        self.quota = quota
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+
+    def _enter(self, operation):
+        with self.lock:
+            self.calls += 1
+            if self.in_flight >= self.quota:
+                self.throttled += 1
+                raise client_error('ThrottlingException', 'Too many requests, please wait before trying again.',
+                                   operation)
+            if self.random.random() < self.error_rate:
+                raise client_error('InternalServerException', 'Internal server error', operation)
+            self.in_flight += 1
+
+    def _exit(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def answer(self, question):
+        refs = [fake_reference(question, n) for n in range(references_per_answer)]
+        text = f"{question.strip()}에 대한 답변입니다."
+        citations = [{
+            'generatedResponsePart': {'textResponsePart': {'text': text, 'span': {'start': 0, 'end': len(text)}}},
+            'retrievedReferences': refs,
+        }]
+        return text, citations
+
+    def retrieve_and_generate(self, input, retrieveAndGenerateConfiguration, **kwargs):
+        self._enter('RetrieveAndGenerate')
+        try:
+            time.sleep(self.latency)
+            text, citations = self.answer(input['text'])
+            return {'sessionId': 'fake-session', 'output': {'text': text}, 'citations': citations}
+        finally:
+            self._exit()
+
+    def _events(self, question):
+        try:
+            text, citations = self.answer(question)
+            time.sleep(self.first_chunk_latency)
+            for i in range(0, len(text), chunk_chars):
+                if i:
+                    time.sleep(self.chunk_interval)
+                yield {'output': {'text': text[i:i + chunk_chars]}}
+            for citation in citations:
+                yield {'citation': {'generatedResponsePart': citation['generatedResponsePart'],
+                                    'retrievedReferences': citation['retrievedReferences']}}
+        finally:
+            self._exit()
+
+    def retrieve_and_generate_stream(self, input, retrieveAndGenerateConfiguration, **kwargs):
+        self._enter('RetrieveAndGenerateStream')
+        return {'sessionId': 'fake-session', 'stream': self._events(input['text'])}
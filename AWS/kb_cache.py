@@ -0,0 +1,106 @@
+"""
+SQLite cache for knowledge base answers
+- key : sha256 of the normalized question, prompt template and the full
+  retrieveAndGenerateConfiguration (KB ID, model ARN, generation config, ...)
+- normalize_question also groups duplicate questions within one run
+- BEDROCK_CACHE_BYPASS=1 skips lookups (fresh answers still overwrite the cache)
+- only the answer is kept: latencies belong to the call that measured them, so hits
+  come back with ttft_sec / latency_sec set to None
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+# --- Config ---
+cache_path = "/data2/jiyoon/Pethroom/data/bedrock_cache.sqlite"
+max_age_days = 90
+bypass = os.environ.get("BEDROCK_CACHE_BYPASS", "") not in ("", "0")
+
+
+def normalize_question(question):
+    """NFKC, lower case, punctuation dropped and whitespace collapsed"""
+    text = unicodedata.normalize('NFKC', question).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def as_cached(response):
+    """Copy of a response without the latencies of the call that produced it"""
+    return {'output': response['output'], 'citations': response.get('citations', []),
+            'ttft_sec': None, 'latency_sec': None}
+
+
+class KBCache:
+    """Thread safe answer cache with hit/miss counters"""
+
+    def __init__(self, path=cache_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key        TEXT PRIMARY KEY,
+                question   TEXT,
+                response   TEXT,
+                created_at REAL,
+                last_used  REAL
+            )
+            """
+        )
+        self.conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - max_age_days * 86400,))
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(question, prompt_template, rag_config):
+        payload = json.dumps(
+            {'question': normalize_question(question), 'prompt_template': prompt_template, 'config': rag_config},
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Cached response dict (no latency metrics), or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return as_cached(json.loads(row[0]))
+
+    def put(self, key, question, response):
+        """Store output text and citations of a response"""
+        keep = {k: response[k] for k in ('output', 'citations') if k in response}
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (key, question, json.dumps(keep, ensure_ascii=False, default=str), now, now),
+            )
+            self.conn.commit()
+
+    def stats(self):
+        return f"KB cache: {self.hits} hits, {self.misses} misses"
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = KBCache()
+        return _cache
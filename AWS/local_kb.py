@@ -0,0 +1,347 @@
+"""
+Local retrieval over the chapter corpus, for testing retrieval without Bedrock
+- build : BM25 inverted index over the chunks in corpus_store (long_form / short_form),
+  plus CPU embedding vectors when boundary_detector.embedding_model is set; saved in
+  index_dir as plain JSON (+ embeddings.npy) and updated incrementally (only videos
+  whose corpus generation changed are re-indexed)
+- query : top-k chunks as {'content_text', 'location', 'start_time'} references,
+  the shape bedrock_kb.references() gives for KB citations
+- eval  : recall@k against the videos/chunks Bedrock cited in a results csv,
+  or against a labels JSONL ({"question": ..., "relevant": [location or video_id, ...]})
+Usage: python local_kb.py build
+       python local_kb.py query "강아지 중성화 시기" -k 5
+       python local_kb.py eval --results /data2/jiyoon/Pethroom/data/bedrock_results.csv
+"""
+
+import os
+import re
+import csv
+import json
+import math
+import time
+import heapq
+import argparse
+from collections import Counter, defaultdict
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'youtube', 'divide_chapter'))
+import corpus_store
+import boundary_detector
+
+# --- Config ---
+index_dir = '/data2/jiyoon/Pethroom/data/local_kb'
+bm25_k1 = 1.2
+bm25_b = 0.75
+recall_ks = [1, 3, 5, 10]
+start_tolerance_sec = 5.0    # a retrieved chunk matches a cited one if their starts are this close
+
+
+# --- Utils ---
+def tokenize(text):
+    """Same words + character bigrams as the local boundary detector"""
+    return boundary_detector.features(text)
+
+
+def chunk_location(kind, video_id, start_sec, title):
+    """Relative path of the chunk in the exported txt layout (what the KB's S3 keys mirror)"""
+    safe_title = re.sub(r'[\\/:*?"<>|]', '', title).strip()
+    if kind == "long_form":
+        return f"{kind}/{video_id}/chunks/{start_sec}_{safe_title}.txt"
+    return f"{kind}/{video_id}_0.0_{safe_title}.txt"
+
+
+def parse_location(location):
+    """(video_id, start_sec or None) of a chunk path / S3 uri in either txt layout"""
+    parts = location.rstrip('/').split('/')
+    name = parts[-1]
+    if len(parts) >= 3 and parts[-2] == "chunks":
+        start = name.split('_', 1)[0]
+        try:
+            return parts[-3], float(start)
+        except ValueError:
+            return parts[-3], None
+    if '_0.0_' in name:
+        return name.split('_0.0_', 1)[0], 0.0
+    return None, None
+
+
+class LocalIndex:
+    """BM25 postings (+ optional embedding matrix) over corpus chunks"""
+
+    def __init__(self):
+        self.docs = {}                       # doc id ("<video_id>:<chunk>") -> reference dict + length
+        self.doc_terms = {}                  # doc id -> Counter, kept so a video can be removed
+        self.postings = defaultdict(dict)    # term -> {doc id: tf}
+        self.total_len = 0
+        self.videos = {}                     # video_id -> [indexed corpus generation, chunk count]
+        self.embedding_model = None          # model the embeddings were made with
+        self.embeddings = {}                 # doc id -> vector (only with an embedding model)
+        self.matrix = None                   # (doc ids, stacked vectors), rebuilt after changes
+
+    # --- persistence ---
+    @classmethod
+    def load(cls, root=index_dir):
+        """Rebuild an index from index.json (+ embeddings.npy); empty if nothing is saved yet"""
+        index = cls()
+        path = os.path.join(root, "index.json")
+        if not os.path.exists(path):
+            return index
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        index.docs = data['docs']
+        index.videos = data['videos']
+        for doc_id, terms in data['doc_terms'].items():
+            index.doc_terms[doc_id] = Counter(terms)
+            for term, tf in terms.items():
+                index.postings[term][doc_id] = tf
+        index.total_len = sum(doc['length'] for doc in index.docs.values())
+
+        embedding_ids = data.get('embedding_ids', [])
+        embedding_path = os.path.join(root, "embeddings.npy")
+        if embedding_ids and os.path.exists(embedding_path):
+            import numpy as np
+            vectors = np.load(embedding_path)
+            if len(vectors) == len(embedding_ids):
+                index.embeddings = dict(zip(embedding_ids, vectors))
+                index.embedding_model = data.get('embedding_model')
+        return index
+
+    def save(self, root=index_dir):
+        """Write docs / term counts / videos as JSON and the embedding matrix as .npy"""
+        os.makedirs(root, exist_ok=True)
+        embedding_ids = list(self.embeddings)
+        if embedding_ids:
+            import numpy as np
+            tmp_path = os.path.join(root, "embeddings.tmp.npy")
+            np.save(tmp_path, np.stack([self.embeddings[d] for d in embedding_ids]))
+            os.replace(tmp_path, os.path.join(root, "embeddings.npy"))
+
+        data = {
+            'docs': self.docs,
+            'doc_terms': self.doc_terms,
+            'videos': self.videos,
+            'embedding_model': self.embedding_model,
+            'embedding_ids': embedding_ids,
+        }
+        tmp_path = os.path.join(root, "index.json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(root, "index.json"))
+
+    # --- maintenance ---
+    def remove_video(self, video_id):
+        _, n_chunks = self.videos.pop(video_id, [None, 0])
+        for doc_id in (f"{video_id}:{i}" for i in range(n_chunks)):
+            for term in self.doc_terms.pop(doc_id):
+                postings = self.postings[term]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+            self.total_len -= self.docs.pop(doc_id)['length']
+            self.embeddings.pop(doc_id, None)
+        self.matrix = None
+
+    def add_video(self, video_id, generation, chapters):
+        """Index the chapters of one video, returns their doc ids"""
+        doc_ids = []
+        for i, ch in enumerate(chapters):
+            doc_id = f"{video_id}:{i}"
+            terms = Counter(tokenize(f"{ch['title']} {ch['text']}"))
+            length = sum(terms.values())
+            self.docs[doc_id] = {
+                'content_text': ch['text'],
+                'location': chunk_location(ch['kind'], video_id, ch['start_sec'], ch['title']),
+                'start_time': str(ch['start_sec']),
+                'length': length,
+            }
+            self.doc_terms[doc_id] = terms
+            for term, tf in terms.items():
+                self.postings[term][doc_id] = tf
+            self.total_len += length
+            doc_ids.append(doc_id)
+        self.videos[video_id] = [generation, len(doc_ids)]
+        return doc_ids
+
+    def update(self, store):
+        """Re-index new or re-chaptered videos, drop deleted ones; returns (added, removed)"""
+        generations = store.generations()
+        stale = [v for v in self.videos if v not in generations]
+        changed = [v for v, g in generations.items() if self.videos.get(v, [None])[0] != g]
+        for video_id in stale + changed:
+            self.remove_video(video_id)
+        new_docs = []
+        for video_id in changed:
+            new_docs += self.add_video(video_id, generations[video_id], store.get_video(video_id))
+
+        if self.embedding_model != boundary_detector.embedding_model:
+            # Vectors of another model can't be compared with new queries: embed everything again
+            self.embeddings, self.matrix = {}, None
+            self.embedding_model = boundary_detector.embedding_model
+            new_docs = list(self.docs)
+        self.embed(new_docs)
+        return len(changed), len(stale)
+
+    def embed(self, doc_ids):
+        if self.embedding_model is None or not doc_ids:
+            return
+        vectors = boundary_detector.embedding_vectors([self.docs[d]['content_text'] for d in doc_ids])
+        if vectors is not None:
+            self.embeddings.update(zip(doc_ids, vectors))
+            self.matrix = None
+
+    # --- search ---
+    def bm25(self, query, k):
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+        avg_len = self.total_len / n_docs
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = bm25_k1 * (1 - bm25_b + bm25_b * self.docs[doc_id]['length'] / avg_len)
+                scores[doc_id] += idf * tf * (bm25_k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def dense(self, query, k):
+        import numpy as np
+        if not self.embeddings:
+            return []
+        if self.embedding_model != boundary_detector.embedding_model:
+            return []
+        query_vector = boundary_detector.embedding_vectors([query])
+        if query_vector is None:
+            return []
+        if self.matrix is None:
+            doc_ids = list(self.embeddings)
+            self.matrix = doc_ids, np.stack([self.embeddings[d] for d in doc_ids])
+        doc_ids, vectors = self.matrix
+        scores = vectors @ query_vector[0]
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        return sorted(((doc_ids[i], float(scores[i])) for i in top), key=lambda item: -item[1])
+
+    def search(self, query, k=5, mode="bm25"):
+        """
+        Top-k references for a query
+        mode : "bm25", "dense" or "hybrid" (reciprocal rank fusion of both)
+        """
+        if mode == "bm25":
+            hits = self.bm25(query, k)
+        elif mode == "dense":
+            hits = self.dense(query, k)
+        else:
+            fused = defaultdict(float)
+            for ranking in (self.bm25(query, k * 4), self.dense(query, k * 4)):
+                for rank, (doc_id, _) in enumerate(ranking):
+                    fused[doc_id] += 1 / (60 + rank)
+            hits = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+        return [
+            {key: self.docs[doc_id][key] for key in ('content_text', 'location', 'start_time')}
+            | {'score': round(score, 4)}
+            for doc_id, score in hits
+        ]
+
+
+def cited_labels(results_csv):
+    """[(question, [(video_id, start_sec)])] from the citations of a bedrock results csv"""
+    labels = {}
+    with open(results_csv, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            entry = labels.setdefault(row['question_number'], (row['question'], []))
+            video_id, start = parse_location(row.get('location', ''))
+            if video_id and (video_id, start) not in entry[1]:
+                entry[1].append((video_id, start))
+    return [entry for entry in labels.values() if entry[1]]
+
+
+def file_labels(labels_jsonl):
+    """[(question, [(video_id, start_sec)])] from a labels JSONL of locations or bare video ids"""
+    labels = []
+    with open(labels_jsonl, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            relevant = []
+            for item in record['relevant']:
+                video_id, start = parse_location(item)
+                relevant.append((video_id, start) if video_id else (item, None))
+            labels.append((record['question'], relevant))
+    return labels
+
+
+def is_match(reference, relevant):
+    video_id, start = parse_location(reference['location'])
+    if video_id != relevant[0]:
+        return False
+    return relevant[1] is None or start is None or abs(start - relevant[1]) <= start_tolerance_sec
+
+
+def evaluate(index, labels, mode):
+    """Mean recall@k at video and chunk level, and ms per query"""
+    k_max = max(recall_ks)
+    video_hits = {k: 0.0 for k in recall_ks}
+    chunk_hits = {k: 0.0 for k in recall_ks}
+    start = time.perf_counter()
+    for question, relevant in labels:
+        refs = index.search(question, k_max, mode)
+        relevant_videos = {video_id for video_id, _ in relevant}
+        for k in recall_ks:
+            top = refs[:k]
+            found_videos = {parse_location(r['location'])[0] for r in top}
+            video_hits[k] += len(relevant_videos & found_videos) / len(relevant_videos)
+            chunk_hits[k] += sum(any(is_match(r, rel) for r in top) for rel in relevant) / len(relevant)
+    elapsed = time.perf_counter() - start
+    n = max(len(labels), 1)
+    return {
+        'questions': len(labels),
+        'ms_per_query': round(elapsed * 1000 / n, 2),
+        **{f'video_recall@{k}': round(video_hits[k] / n, 3) for k in recall_ks},
+        **{f'chunk_recall@{k}': round(chunk_hits[k] / n, 3) for k in recall_ks},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local BM25 / embedding retrieval over the chapter corpus")
+    parser.add_argument("command", choices=["build", "query", "eval"])
+    parser.add_argument("text", nargs="?", help="query text")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--mode", choices=["bm25", "dense", "hybrid"], default="bm25")
+    parser.add_argument("--index-dir", default=index_dir)
+    parser.add_argument("--results", help="bedrock results csv whose citations are the relevant chunks")
+    parser.add_argument("--labels", help="JSONL with question and relevant locations / video ids")
+    args = parser.parse_args()
+
+    index = LocalIndex.load(args.index_dir)
+
+    if args.command == "build":
+        start = time.time()
+        added, removed = index.update(corpus_store.get_store())
+        index.save(args.index_dir)
+        print(f"✅ Indexed {added} new/changed videos, removed {removed} "
+              f"({len(index.docs)} chunks, {len(index.postings)} terms, {time.time() - start:.1f}s)")
+
+    elif args.command == "query":
+        if not args.text:
+            parser.error("query needs the question text")
+        start = time.perf_counter()
+        refs = index.search(args.text, args.k, args.mode)
+        print(f"{len(refs)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for ref in refs:
+            print(f"\n- [score]: {ref['score']}\n- [start_time]: {ref['start_time']}")
+            print(f"- [content]: {ref['content_text'][:50]}...\n- [location]: {ref['location']}")
+
+    else:
+        if not (args.results or args.labels):
+            parser.error("eval needs --results or --labels")
+        labels = cited_labels(args.results) if args.results else file_labels(args.labels)
+        for name, value in evaluate(index, labels, args.mode).items():
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
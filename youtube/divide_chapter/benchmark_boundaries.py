@@ -0,0 +1,162 @@
+"""
+Compare local boundary detection (boundary_detector.py) with the existing GPT-4o chapters
+- input : subtitles (segment store or CSV) of long form videos that already have chapters
+  (corpus store, or titles_<id>.txt from before it)
+- output : csv with boundary precision/recall/F1 per video, plus prompt tokens and
+  latency of the full-transcript request vs. the local "title these sections" request
+An evenly spaced split with the same number of chapters is scored as a baseline.
+With --llm both requests are actually sent (cache bypassed) to time them.
+"""
+import os
+import csv
+import time
+import argparse
+
+import numpy as np
+
+import llm_cache
+import long_form
+import corpus_store
+import boundary_detector
+import subtitle_source
+
+# --- Config ---
+output_csv_path = "/data2/jiyoon/Pethroom/data/chapters/boundary_benchmark.csv"
+tolerances_sec = [30, 60]
+max_videos = 200
+
+
+# --- Utils ---
+def reference_boundaries(video_id):
+    """Chapter start seconds of the existing output, or None if the video has none"""
+    chapters = corpus_store.get_store().get_video(video_id)
+    if chapters:
+        return [ch['start_sec'] for ch in chapters]
+
+    titles_path = os.path.join(long_form.root_output_path, video_id, f"titles_{video_id}.txt")
+    if not os.path.exists(titles_path):
+        return None
+    with open(titles_path, 'r', encoding='utf-8') as f:
+        chapters = long_form.parse_chapter_lines(f.read())
+    return [float(long_form.hms_to_seconds(ch['start_time'])) for ch in chapters] or None
+
+
+def uniform_boundaries(starts, n_chapters):
+    """n_chapters evenly spaced chapters snapped to segment starts"""
+    times = np.linspace(starts[0], starts[-1], n_chapters, endpoint=False)
+    return [float(starts[i]) for i in np.searchsorted(starts, times, side='left')]
+
+
+def full_prompt_tokens(df):
+    """Prompt tokens the current single/windowed path sends for this video"""
+    script, _, tokens_after, window_sec = long_form.compact_transcript(df)
+    if long_form.use_windowed(tokens_after):
+        messages = [long_form.chapter_messages(s, long_form.window_prompt(own_start))
+                    for own_start, _, _, s in long_form.window_scripts(df, window_sec)]
+    else:
+        messages = [long_form.chapter_messages(script)]
+    return sum(long_form.count_tokens(m['content']) for msgs in messages for m in msgs)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def evaluate(csv_path, with_llm=False):
+    video_id, df, _ = long_form.load_subtitles(csv_path)
+    if df is None:
+        return None
+    reference = reference_boundaries(video_id)
+    if not reference:
+        return None
+
+    starts, texts = long_form.segment_arrays(df)
+    predicted, detect_sec = timed(boundary_detector.detect_boundaries, starts, texts)
+    local_script = long_form.local_chapter_script(df)
+    local_messages = long_form.chapter_messages(local_script, long_form.local_system_prompt)
+
+    row = {
+        'video_id': video_id,
+        'duration_sec': round(float(starts[-1]), 1),
+        'reference_chapters': len(reference),
+        'local_chapters': len(predicted),
+        'detect_ms': round(detect_sec * 1000, 1),
+        'full_prompt_tokens': full_prompt_tokens(df),
+        'local_prompt_tokens': sum(long_form.count_tokens(m['content']) for m in local_messages),
+    }
+
+    uniform = uniform_boundaries(starts, len(reference))
+    for tolerance in tolerances_sec:
+        local = boundary_detector.boundary_agreement(predicted, reference, tolerance)
+        base = boundary_detector.boundary_agreement(uniform, reference, tolerance)
+        row.update({
+            f'local_p@{tolerance}': round(local['precision'], 3),
+            f'local_r@{tolerance}': round(local['recall'], 3),
+            f'local_f1@{tolerance}': round(local['f1'], 3),
+            f'uniform_f1@{tolerance}': round(base['f1'], 3),
+        })
+
+    if with_llm:
+        bypass, llm_cache.bypass = llm_cache.bypass, True
+        try:
+            script, *_ = long_form.compact_transcript(df)
+            _, row['full_llm_sec'] = timed(long_form.generate_chapters_with_llm, script)
+            _, row['local_llm_sec'] = timed(long_form.generate_chapters_with_llm, local_script,
+                                            long_form.local_system_prompt)
+        finally:
+            llm_cache.bypass = bypass
+        row['full_llm_sec'] = round(row['full_llm_sec'], 2)
+        row['local_llm_sec'] = round(row['local_llm_sec'] + detect_sec, 2)
+
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local boundary detection vs. existing LLM chapters")
+    parser.add_argument("--max-videos", type=int, default=max_videos)
+    parser.add_argument("--llm", action="store_true", help="also time both LLM requests (costs API calls)")
+    parser.add_argument("--output", default=output_csv_path)
+    args = parser.parse_args()
+
+    csv_files = subtitle_source.file_names("long_form", long_form.input_csv_folder)
+    rows = []
+    for csv_file in csv_files:
+        if len(rows) >= args.max_videos:
+            break
+        row = evaluate(os.path.join(long_form.input_csv_folder, csv_file), args.llm)
+        if row:
+            rows.append(row)
+            print(f"{row['video_id']}: F1@{tolerances_sec[0]}s {row[f'local_f1@{tolerances_sec[0]}']:.2f}, "
+                  f"tokens {row['full_prompt_tokens']} -> {row['local_prompt_tokens']}")
+
+    if not rows:
+        print("❌ No videos with existing chapters found")
+        return False
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n{'='*50}")
+    print(f"Videos: {len(rows)}")
+    for tolerance in tolerances_sec:
+        local = np.mean([r[f'local_f1@{tolerance}'] for r in rows])
+        base = np.mean([r[f'uniform_f1@{tolerance}'] for r in rows])
+        print(f"Boundary F1 @{tolerance}s: local {local:.3f}, evenly spaced {base:.3f}")
+    full = sum(r['full_prompt_tokens'] for r in rows)
+    local = sum(r['local_prompt_tokens'] for r in rows)
+    print(f"Prompt tokens: {full} -> {local} ({1 - local / max(full, 1):.1%} saved)")
+    print(f"Detector: {np.mean([r['detect_ms'] for r in rows]):.1f} ms per video")
+    if args.llm:
+        print(f"LLM latency: {np.mean([r['full_llm_sec'] for r in rows]):.2f}s -> "
+              f"{np.mean([r['local_llm_sec'] for r in rows]):.2f}s per video")
+    print(f"Results saved to {args.output}")
+    return True
+
+
+if __name__ == "__main__":
+    main()
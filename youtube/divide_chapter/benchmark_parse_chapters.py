@@ -0,0 +1,87 @@
+"""
+Micro-benchmark for chapter slicing on synthetic transcripts
+- legacy : two `df[df['start'] >= t].index.min()` scans per chapter
+- current : parse_llm_chapters (searchsorted over segment arrays)
+"""
+import time
+import numpy as np
+import pandas as pd
+
+from long_form import format_time_to_hms, parse_llm_chapters, segment_arrays, hms_to_seconds, parse_chapter_lines
+
+# --- Config ---
+segment_counts = [10_000, 50_000, 200_000]
+chapter_counts = [20, 200]
+repeats = 5
+seed = 0
+
+
+def make_transcript(n_segments, rng):
+    """Whisper-like segments, 1-6 s long, with a few empty texts"""
+    durations = rng.uniform(1.0, 6.0, n_segments)
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    texts = [f"문장 {i} 강아지 산책 이야기" for i in range(n_segments)]
+    for i in rng.choice(n_segments, n_segments // 100, replace=False):
+        texts[i] = None
+    return pd.DataFrame({'start': starts, 'end': starts + durations, 'text': texts})
+
+
+def make_llm_output(df, n_chapters, rng):
+    """'HH:MM:SS title' lines at random (sorted) times, starting at 00:00:00"""
+    times = np.sort(rng.uniform(0, df['start'].iloc[-1], n_chapters - 1))
+    lines = ["00:00:00 시작"] + [f"{format_time_to_hms(t)} 챕터 {i}" for i, t in enumerate(times, 1)]
+    return "\n".join(lines)
+
+
+def legacy_parse(llm_output, df):
+    """Previous implementation, kept here only for comparison"""
+    chapters_data = parse_chapter_lines(llm_output)
+    final_chapters = []
+    for i, chapter in enumerate(chapters_data):
+        start_index = df[df['start'] >= hms_to_seconds(chapter['start_time'])].index.min()
+        if pd.isna(start_index):
+            start_index = 0
+        if i + 1 < len(chapters_data):
+            end_index = df[df['start'] >= hms_to_seconds(chapters_data[i + 1]['start_time'])].index.min()
+        else:
+            end_index = len(df)
+        chapter_chunk = df.iloc[start_index:end_index]
+        if not chapter_chunk.empty:
+            final_chapters.append({
+                'start_time': chapter['start_time'],
+                'title': chapter['title'],
+                'text': " ".join(chapter_chunk['text'].dropna().astype(str).tolist()),
+                'start_sec': chapter_chunk.iloc[0]['start']
+            })
+    return final_chapters
+
+
+def best_of(fn):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    rng = np.random.default_rng(seed)
+    print(f"{'segments':>10} {'chapters':>9} {'legacy ms':>10} {'current ms':>11} {'speedup':>8}")
+
+    for n_segments in segment_counts:
+        df = make_transcript(n_segments, rng)
+        for n_chapters in chapter_counts:
+            llm_output = make_llm_output(df, n_chapters, rng)
+
+            legacy_sec, legacy = best_of(lambda: legacy_parse(llm_output, df))
+            current_sec, current = best_of(lambda: parse_llm_chapters(llm_output, *segment_arrays(df)))
+
+            assert [c['text'] for c in legacy] == [c['text'] for c in current], "chapter text mismatch"
+
+            print(f"{n_segments:>10} {n_chapters:>9} {legacy_sec * 1000:>10.1f} "
+                  f"{current_sec * 1000:>11.1f} {legacy_sec / current_sec:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Local chapter boundary detection over subtitle segments (TextTiling style)
+- segments are grouped into block_sec blocks
+- each block becomes a tf-idf vector of words + character bigrams (hashed, numpy only),
+  or a sentence embedding when embedding_model is set and sentence-transformers is installed
+- similarity between the tiling_window blocks left and right of every gap, smoothed
+- depth score = how far the similarity dips below the peaks on both sides;
+  the deepest gaps, at least min_chapter_sec apart, become chapter boundaries
+Used by long_form.py's "local" chaptering mode, where the LLM only titles the sections
+"""
+import re
+import zlib
+
+import numpy as np
+
+# --- Config ---
+block_sec = 20                 # segments merged into one pseudo-sentence block
+tiling_window = 6              # blocks compared on each side of a gap
+smoothing_width = 3            # moving average over gap similarities
+min_chapter_sec = 120          # no two boundaries closer than this
+max_chapters_per_hour = 20
+hash_dim = 1 << 14             # hashed vocabulary size
+embedding_model = None         # e.g. "jhgan/ko-sroberta-multitask" (needs sentence-transformers)
+
+_token_pattern = re.compile(r'\w+')
+_embedder = None
+
+
+def params():
+    """Everything that changes the boundaries for the same transcript"""
+    return (block_sec, tiling_window, smoothing_width, min_chapter_sec, max_chapters_per_hour, hash_dim,
+            embedding_model)
+
+
+def make_blocks(starts, texts):
+    """
+    Merge segments into block_sec blocks
+    Returns (block start times, block texts, index of each block's first segment)
+    """
+    block_ids = (np.asarray(starts, dtype=float) // block_sec).astype(int)
+    firsts = np.flatnonzero(np.r_[True, block_ids[1:] != block_ids[:-1]])
+    ends = np.r_[firsts[1:], len(block_ids)]
+    block_texts = [" ".join(t for t in texts[a:b] if t) for a, b in zip(firsts, ends)]
+    return np.asarray(starts, dtype=float)[firsts], block_texts, firsts
+
+
+def features(text):
+    """Words plus the character bigrams inside them (robust to Korean particles)"""
+    tokens = []
+    for word in _token_pattern.findall(text.lower()):
+        tokens.append(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def lexical_vectors(block_texts):
+    """Hashed tf-idf matrix, one row per block"""
+    matrix = np.zeros((len(block_texts), hash_dim), dtype=np.float32)
+    for row, text in enumerate(block_texts):
+        for token in features(text):
+            matrix[row, zlib.crc32(token.encode('utf-8')) % hash_dim] += 1.0
+    df = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(block_texts)) / (1 + df)).astype(np.float32)
+    return matrix * idf
+
+
+def embedding_vectors(block_texts):
+    """Sentence embeddings of the blocks, or None without sentence-transformers"""
+    global _embedder
+    if embedding_model is None:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    if _embedder is None:
+        _embedder = SentenceTransformer(embedding_model, device="cpu")
+    return _embedder.encode(block_texts, normalize_embeddings=True, convert_to_numpy=True)
+
+
+def gap_similarities(vectors):
+    """Cosine similarity of the windows left and right of every gap between blocks"""
+    cumulative = np.vstack([np.zeros((1, vectors.shape[1]), dtype=vectors.dtype), np.cumsum(vectors, axis=0)])
+    n = len(vectors)
+    gaps = np.arange(1, n)
+    left = cumulative[gaps] - cumulative[np.maximum(gaps - tiling_window, 0)]
+    right = cumulative[np.minimum(gaps + tiling_window, n)] - cumulative[gaps]
+    norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+    sims = np.einsum('ij,ij->i', left, right) / np.where(norms > 0, norms, 1.0)
+
+    if smoothing_width > 1 and len(sims) >= smoothing_width:
+        kernel = np.ones(smoothing_width) / smoothing_width
+        sims = np.convolve(np.pad(sims, smoothing_width // 2, mode='edge'), kernel, mode='valid')
+    return sims
+
+
+def depth_scores(sims):
+    """Depth of every gap: climb to the highest similarity on each side"""
+    left_peak = np.maximum.accumulate(sims)
+    right_peak = np.maximum.accumulate(sims[::-1])[::-1]
+    return (left_peak - sims) + (right_peak - sims)
+
+
+def detect_boundaries(starts, texts):
+    """
+    Candidate chapter start times (segment starts, always beginning with the first segment)
+    starts : sorted segment start times, texts : segment texts (None allowed)
+    """
+    starts = np.asarray(starts, dtype=float)
+    if len(starts) == 0:
+        return []
+
+    block_starts, block_texts, _ = make_blocks(starts, texts)
+    if len(block_texts) < 2 * tiling_window:
+        return [float(starts[0])]
+
+    vectors = embedding_vectors(block_texts)
+    if vectors is None:
+        vectors = lexical_vectors(block_texts)
+
+    sims = gap_similarities(vectors)
+    depths = depth_scores(sims)
+    cutoff = depths.mean() + depths.std() / 2
+
+    duration = starts[-1] - starts[0]
+    max_boundaries = max(int(duration / 3600 * max_chapters_per_hour), 1)
+
+    chosen = []
+    for gap in np.argsort(-depths, kind='stable'):
+        if depths[gap] <= cutoff or len(chosen) >= max_boundaries:
+            break
+        seconds = block_starts[gap + 1]
+        if seconds - starts[0] < min_chapter_sec or starts[-1] - seconds < min_chapter_sec:
+            continue
+        if all(abs(seconds - other) >= min_chapter_sec for other in chosen):
+            chosen.append(float(seconds))
+
+    return [float(starts[0])] + sorted(chosen)
+
+
+def boundary_agreement(predicted, reference, tolerance_sec=30.0):
+    """
+    Precision / recall / F1 of predicted boundaries against reference ones
+    The opening 00:00:00 chapter is ignored; each reference matches at most one prediction
+    """
+    predicted = sorted(p for p in predicted if p > 0)
+    reference = sorted(r for r in reference if r > 0)
+    unmatched = list(reference)
+    hits, distances = 0, []
+    for p in predicted:
+        if not unmatched:
+            break
+        nearest = min(unmatched, key=lambda r: abs(r - p))
+        if abs(nearest - p) <= tolerance_sec:
+            unmatched.remove(nearest)
+            hits += 1
+            distances.append(abs(nearest - p))
+
+    precision = hits / len(predicted) if predicted else float(not reference)
+    recall = hits / len(reference) if reference else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'mean_offset_sec': float(np.mean(distances)) if distances else None,
+    }
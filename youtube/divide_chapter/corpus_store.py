@@ -0,0 +1,220 @@
+"""
+Chapter corpus in one SQLite file instead of thousands of small txt files
+- long form chapters and short form titles, one row per chapter
+- append only: re-chaptering a video adds a new generation, readers see the latest
+- indexed by (video_id, generation, start_sec) for lookups by video or time range
+- export : materialize the old titles_<id>.txt / chunks/ / <id>_0.0_<title>.txt layout
+- import : load outputs written in that layout before the store existed
+"""
+import os
+import re
+import time
+import sqlite3
+import argparse
+import threading
+
+# --- Config ---
+corpus_path = "/data2/jiyoon/Pethroom/data/chapters/corpus.sqlite"
+
+
+class CorpusStore:
+    """Thread safe append-only chapter store"""
+
+    def __init__(self, path=corpus_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chapters (
+                id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_id      TEXT NOT NULL,
+                kind          TEXT NOT NULL,
+                generation    INTEGER NOT NULL,
+                chapter_index INTEGER NOT NULL,
+                start_time    TEXT,
+                start_sec     REAL,
+                title         TEXT,
+                text          TEXT,
+                created_at    REAL
+            );
+            CREATE INDEX IF NOT EXISTS chapters_video_time
+                ON chapters (video_id, generation, start_sec);
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id   TEXT PRIMARY KEY,
+                kind       TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                updated_at REAL
+            );
+            """
+        )
+        self.conn.commit()
+
+    def append(self, video_id, kind, chapters):
+        """
+        Add a new generation of chapters for a video in one transaction
+        chapters : [{'start_time', 'start_sec', 'title', 'text'}]
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT generation FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+            generation = row[0] + 1 if row else 1
+            self.conn.executemany(
+                "INSERT INTO chapters (video_id, kind, generation, chapter_index, start_time, start_sec, title, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (video_id, kind, generation, i, ch['start_time'], float(ch['start_sec']), ch['title'], ch['text'], now)
+                    for i, ch in enumerate(chapters)
+                ],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?)", (video_id, kind, generation, now)
+            )
+        return generation
+
+    def _rows(self, query, params):
+        with self.lock:
+            cursor = self.conn.execute(query, params)
+            names = [c[0] for c in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def get_video(self, video_id):
+        """Latest chapters of a video, in time order"""
+        return self._rows(
+            """
+            SELECT c.video_id, c.kind, c.start_time, c.start_sec, c.title, c.text
+            FROM chapters c JOIN videos v ON c.video_id = v.video_id AND c.generation = v.generation
+            WHERE c.video_id = ? ORDER BY c.start_sec
+            """,
+            (video_id,),
+        )
+
+    def get_range(self, video_id, start_sec, end_sec):
+        """Latest chapters of a video starting in [start_sec, end_sec)"""
+        return self._rows(
+            """
+            SELECT c.video_id, c.kind, c.start_time, c.start_sec, c.title, c.text
+            FROM chapters c JOIN videos v ON c.video_id = v.video_id AND c.generation = v.generation
+            WHERE c.video_id = ? AND c.start_sec >= ? AND c.start_sec < ? ORDER BY c.start_sec
+            """,
+            (video_id, start_sec, end_sec),
+        )
+
+    def video_ids(self, kind=None):
+        if kind is None:
+            rows = self._rows("SELECT video_id FROM videos ORDER BY video_id", ())
+        else:
+            rows = self._rows("SELECT video_id FROM videos WHERE kind = ? ORDER BY video_id", (kind,))
+        return [r['video_id'] for r in rows]
+
+    def generations(self, kind=None):
+        """{video_id: latest generation}, for incremental consumers of the corpus"""
+        if kind is None:
+            rows = self._rows("SELECT video_id, generation FROM videos", ())
+        else:
+            rows = self._rows("SELECT video_id, generation FROM videos WHERE kind = ?", (kind,))
+        return {r['video_id']: r['generation'] for r in rows}
+
+    def has_video(self, video_id):
+        return bool(self._rows("SELECT 1 AS found FROM videos WHERE video_id = ?", (video_id,)))
+
+    def iter_chapters(self, kind=None):
+        """Every latest chapter, video by video"""
+        for video_id in self.video_ids(kind):
+            yield from self.get_video(video_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CorpusStore()
+        return _store
+
+
+def export_txt(store, kind, root_path, video_ids=None):
+    """Write the legacy txt layout for downstream consumers that still need files"""
+    import long_form
+    import short_form
+
+    count = 0
+    for video_id in video_ids or store.video_ids(kind):
+        chapters = store.get_video(video_id)
+        if not chapters:
+            continue
+        if chapters[0]['kind'] == "long_form":
+            long_form.save_chapters_to_files(chapters, video_id, root_path)
+        else:
+            ch = chapters[0]
+            short_form.save_content_to_file(ch['title'], ch['text'], video_id, root_path)
+        count += 1
+    return count
+
+
+def read_long_form_dir(video_dir, video_id):
+    """Chapters of one legacy titles_<id>.txt + chunks/ directory"""
+    titles_path = os.path.join(video_dir, f"titles_{video_id}.txt")
+    chunks_dir = os.path.join(video_dir, "chunks")
+    if not os.path.exists(titles_path) or not os.path.isdir(chunks_dir):
+        return []
+
+    with open(titles_path, 'r', encoding='utf-8') as f:
+        titles = [line.rstrip('\n').split(' ', 1) for line in f if line.strip()]
+    chunk_files = sorted(
+        (f for f in os.listdir(chunks_dir) if f.endswith('.txt')), key=lambda f: float(f.split('_', 1)[0])
+    )
+    chapters = []
+    for (start_time, title), file_name in zip(titles, chunk_files):
+        with open(os.path.join(chunks_dir, file_name), 'r', encoding='utf-8') as f:
+            text = f.read()
+        chapters.append({'start_time': start_time, 'start_sec': float(file_name.split('_', 1)[0]),
+                         'title': title, 'text': text})
+    return chapters
+
+
+def import_txt(store, kind, root_path):
+    """Append legacy txt outputs of videos the store does not have yet"""
+    count = 0
+    for name in sorted(os.listdir(root_path)):
+        if name.startswith('.'):
+            continue
+        if kind == "long_form":
+            video_id = name
+            chapters = read_long_form_dir(os.path.join(root_path, name), video_id)
+        else:
+            match = re.match(r'(.+?)_0\.0_(.*)\.txt$', name)
+            if not match:
+                continue
+            video_id, title = match.groups()
+            with open(os.path.join(root_path, name), 'r', encoding='utf-8') as f:
+                chapters = [{'start_time': "00:00:00", 'start_sec': 0.0, 'title': title, 'text': f.read()}]
+        if chapters and not store.has_video(video_id):
+            store.append(video_id, kind, chapters)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the chapter corpus as txt files, or import old ones")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("kind", choices=["long_form", "short_form"])
+    parser.add_argument("path", help="txt layout root directory")
+    parser.add_argument("--video-id", action="append", help="export only these videos (repeatable)")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == "export":
+        count = export_txt(store, args.kind, args.path, args.video_id)
+        print(f"✅ Exported {count} videos to {args.path}")
+    else:
+        count = import_txt(store, args.kind, args.path)
+        print(f"✅ Imported {count} videos from {args.path}")
+
+
+if __name__ == "__main__":
+    main()
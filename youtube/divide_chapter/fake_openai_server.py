@@ -0,0 +1,251 @@
+"""
+Local stand-in for the OpenAI chat completions and batch endpoints
+- POST /v1/chat/completions with canned chapter lists / titles
+- optional latency and injected 429 / 500 responses to exercise retries
+- POST /v1/files, GET /v1/files/{id}/content, POST /v1/batches, GET /v1/batches/{id}
+  (batches finish --batch-delay seconds after creation, kept in memory)
+Usage: python fake_openai_server.py --port 8900 --rate-429 0.2
+       OPENAI_BASE_URL=http://127.0.0.1:8900/v1 python llm_driver.py
+"""
+import re
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- Config ---
+host = "127.0.0.1"
+port = 8900
+chapters_per_script = 5
+
+_ids = itertools.count(1)
+_files = {}    # file id -> {'meta': file object, 'data': bytes}
+_batches = {}  # batch id -> batch object (+ '_ready_at')
+_store_lock = threading.RLock()
+
+
+def fake_completion(messages):
+    """Chapters from the script's timestamps, packed {video_id: title} JSON, or a title from its first words"""
+    system = messages[0]['content'] if messages else ""
+    user = messages[-1]['content'] if messages else ""
+
+    if 'JSON' in system:
+        try:
+            items = json.loads(user.split("\n\n", 1)[-1])
+            return json.dumps({item['video_id']: item['script'].strip()[:15] or "제목" for item in items},
+                              ensure_ascii=False)
+        except (ValueError, KeyError, TypeError):
+            return "{}"
+
+    times = re.findall(r'\[(\d{2}:\d{2}:\d{2})\]', user)
+    if '챕터' in system and times:
+        step = max(len(times) // chapters_per_script, 1)
+        picked = times[::step][:chapters_per_script]
+        return "\n".join(f"{t} 챕터 {i}" for i, t in enumerate(picked, 1))
+
+    script = user.split("\n\n", 1)[-1]
+    return script.strip()[:15] or "제목"
+
+
+def completion_body(model, content, messages):
+    prompt_tokens = sum(len(m['content']) // 2 for m in messages)
+    return {
+        'id': f"chatcmpl-fake-{next(_ids)}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(content) // 2,
+            'total_tokens': prompt_tokens + len(content) // 2,
+        },
+    }
+
+
+def parse_multipart(content_type, body):
+    """{field name: (filename, bytes)} from a multipart/form-data body"""
+    message = BytesParser(policy=default_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+def store_file(filename, data, purpose):
+    file_id = f"file-fake-{next(_ids)}"
+    meta = {
+        'id': file_id, 'object': 'file', 'bytes': len(data), 'created_at': int(time.time()),
+        'filename': filename or 'upload.jsonl', 'purpose': purpose, 'status': 'processed',
+    }
+    with _store_lock:
+        _files[file_id] = {'meta': meta, 'data': data}
+    return meta
+
+
+def run_batch(input_data):
+    """Answer every chat completion line of a batch input file"""
+    lines = []
+    for line in input_data.decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        body = request['body']
+        messages = body.get('messages', [])
+        lines.append(json.dumps({
+            'id': f"batch_req_fake_{next(_ids)}",
+            'custom_id': request['custom_id'],
+            'response': {
+                'status_code': 200,
+                'request_id': f"req_fake_{next(_ids)}",
+                'body': completion_body(body.get('model', 'gpt-4o'), fake_completion(messages), messages),
+            },
+            'error': None,
+        }, ensure_ascii=False))
+    return "\n".join(lines).encode('utf-8'), len(lines)
+
+
+def refresh_batch(batch):
+    """Complete the batch once its delay has passed"""
+    if batch['status'] == 'in_progress' and time.time() >= batch['_ready_at']:
+        output, count = run_batch(_files[batch['input_file_id']]['data'])
+        batch['output_file_id'] = store_file('batch_output.jsonl', output, 'batch_output')['id']
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+        batch['request_counts'] = {'total': count, 'completed': count, 'failed': 0}
+    return {k: v for k, v in batch.items() if not k.startswith('_')}
+
+
+def make_handler(args):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_GET(self):
+            path = self.path.rstrip('/')
+            if path.startswith('/v1/files/') and path.endswith('/content'):
+                entry = _files.get(path.split('/')[3])
+                if entry is None:
+                    self.send_json(404, {'error': {'message': 'no such file'}})
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(entry['data'])))
+                self.end_headers()
+                self.wfile.write(entry['data'])
+            elif path.startswith('/v1/batches/'):
+                with _store_lock:
+                    batch = _batches.get(path.split('/')[3])
+                    body = refresh_batch(batch) if batch else None
+                if body is None:
+                    self.send_json(404, {'error': {'message': 'no such batch'}})
+                else:
+                    self.send_json(200, body)
+            else:
+                self.send_json(404, {'error': {'message': 'not found'}})
+
+        def create_file(self):
+            length = int(self.headers.get('Content-Length', 0))
+            fields = parse_multipart(self.headers.get('Content-Type', ''), self.rfile.read(length))
+            filename, data = fields.get('file', (None, b''))
+            purpose = (fields.get('purpose', (None, b'batch'))[1] or b'batch').decode('utf-8')
+            self.send_json(200, store_file(filename, data, purpose))
+
+        def create_batch(self):
+            request = self.read_json()
+            if request.get('input_file_id') not in _files:
+                self.send_json(400, {'error': {'message': 'unknown input_file_id'}})
+                return
+            batch = {
+                'id': f"batch_fake_{next(_ids)}", 'object': 'batch',
+                'endpoint': request.get('endpoint', '/v1/chat/completions'),
+                'input_file_id': request['input_file_id'],
+                'completion_window': request.get('completion_window', '24h'),
+                'status': 'in_progress', 'created_at': int(time.time()),
+                'output_file_id': None, 'error_file_id': None,
+                'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+                '_ready_at': time.time() + args.batch_delay,
+            }
+            with _store_lock:
+                _batches[batch['id']] = batch
+                body = refresh_batch(batch)
+            self.send_json(200, body)
+
+        def do_POST(self):
+            path = self.path.rstrip('/')
+            if path == '/v1/files':
+                self.create_file()
+                return
+            if path == '/v1/batches':
+                self.create_batch()
+                return
+            if path != '/v1/chat/completions':
+                self.send_json(404, {'error': {'message': 'not found'}})
+                return
+
+            request = self.read_json()
+            time.sleep(args.latency)
+
+            roll = random.random()
+            if roll < args.rate_429:
+                self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                               {'Retry-After': '0.1'})
+                return
+            if roll < args.rate_429 + args.rate_500:
+                self.send_json(500, {'error': {'message': 'Internal server error', 'type': 'server_error'}})
+                return
+
+            messages = request.get('messages', [])
+            self.send_json(200, completion_body(request.get('model', 'gpt-4o'), fake_completion(messages), messages))
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server for offline runs")
+    parser.add_argument("--host", default=host)
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="fraction of requests answered 500")
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="seconds until a batch completes")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"✅ Fake OpenAI server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Content-addressed SQLite cache for chat completions
+- key : sha256 of model, messages (system prompt + user content) and sampling params
+- eviction by age and total size, least recently used first
+- LLM_CACHE_BYPASS=1 skips lookups (fresh answers still overwrite the cache)
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import openai
+
+# --- Config ---
+cache_path = "/data2/jiyoon/Pethroom/data/llm_cache.sqlite"
+max_age_days = 180
+max_cache_bytes = 512 * 1024 ** 2
+bypass = os.environ.get("LLM_CACHE_BYPASS", "") not in ("", "0")
+
+
+class LLMCache:
+    """Thread safe completion cache with hit/miss counters"""
+
+    def __init__(self, path=cache_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key        TEXT PRIMARY KEY,
+                model      TEXT,
+                response   TEXT,
+                size       INTEGER,
+                created_at REAL,
+                last_used  REAL
+            )
+            """
+        )
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model, messages, params):
+        payload = json.dumps(
+            {'model': model, 'messages': messages, 'params': params},
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode('utf-8')), now, now),
+            )
+            self.conn.commit()
+
+    def evict(self):
+        """Drop entries older than max_age_days, then LRU entries over max_cache_bytes"""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM completions WHERE created_at < ?", (time.time() - max_age_days * 86400,)
+            )
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+            if total > max_cache_bytes:
+                rows = self.conn.execute("SELECT key, size FROM completions ORDER BY last_used").fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= max_cache_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self.conn.executemany("DELETE FROM completions WHERE key = ?", stale)
+            self.conn.commit()
+
+    def stats(self):
+        return f"LLM cache: {self.hits} hits, {self.misses} misses"
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def chat(model, messages, **params):
+    """
+    openai.chat.completions.create through the cache, returns the stripped message content
+    API errors are raised as usual
+    """
+    cache = get_cache()
+    key = LLMCache.make_key(model, messages, params)
+
+    if not bypass:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = openai.chat.completions.create(model=model, messages=messages, **params)
+    content = response.choices[0].message.content.strip()
+    cache.put(key, model, content)
+    return content
@@ -0,0 +1,248 @@
+"""
+Async driver for long form chapters and short form titles
+- bounded concurrency over every pending video of both folders
+- one requests/min + tokens/min limiter shared by all jobs
+- exponential backoff with jitter on 429 / 5xx / connection errors
+- per-video success/failure report
+Point OPENAI_BASE_URL at fake_openai_server.py to run it offline
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import openai
+
+import llm_cache
+import long_form
+import short_form
+import subtitle_source
+
+# --- Config ---
+model = "gpt-4o"
+concurrency = 8
+requests_per_minute = 450
+tokens_per_minute = 250000
+max_retries = 6
+backoff_base_sec = 1.0
+backoff_max_sec = 60.0
+chapter_output_tokens = 800   # reserved in the TPM budget per request
+title_output_tokens = 30
+report_path = "/data2/jiyoon/Pethroom/data/chapters/llm_driver_report.json"
+
+
+class RateLimiter:
+    """
+    Continuously refilling request and token buckets
+    Waiters are served in order, so a big request is not starved by small ones
+    """
+
+    def __init__(self, rpm, tpm):
+        self.capacity = {'requests': rpm, 'tokens': tpm}
+        self.level = dict(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        for name, cap in self.capacity.items():
+            self.level[name] = min(cap, self.level[name] + cap * elapsed / 60)
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.capacity['tokens'])
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.level['requests'] >= 1 and self.level['tokens'] >= tokens:
+                    self.level['requests'] -= 1
+                    self.level['tokens'] -= tokens
+                    return
+                wait = max(
+                    (1 - self.level['requests']) / self.capacity['requests'],
+                    (tokens - self.level['tokens']) / self.capacity['tokens'],
+                ) * 60
+                await asyncio.sleep(max(wait, 0.01))
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def backoff_delay(attempt, error=None):
+    """Full jitter backoff, honouring Retry-After when the server sends one"""
+    delay = random.uniform(0, min(backoff_max_sec, backoff_base_sec * 2 ** attempt))
+    response = getattr(error, 'response', None)
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+class AsyncLLM:
+    """AsyncOpenAI client behind the shared limiter and the completion cache"""
+
+    def __init__(self, limiter):
+        self.client = openai.AsyncOpenAI(
+            api_key=openai.api_key, base_url=os.environ.get("OPENAI_BASE_URL"), max_retries=0
+        )
+        self.limiter = limiter
+        self.cache = llm_cache.get_cache()
+        self.requests = 0
+        self.retries = 0
+
+    async def chat(self, messages, output_tokens, job=None, **params):
+        key = llm_cache.LLMCache.make_key(model, messages, params)
+        if not llm_cache.bypass:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        input_tokens = sum(long_form.count_tokens(m['content']) for m in messages)
+        for attempt in range(max_retries + 1):
+            await self.limiter.acquire(input_tokens + output_tokens)
+            self.requests += 1
+            if job is not None:
+                job['attempts'] += 1
+            try:
+                response = await self.client.chat.completions.create(model=model, messages=messages, **params)
+                content = response.choices[0].message.content.strip()
+                self.cache.put(key, model, content)
+                return content
+            except Exception as e:
+                if attempt == max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, e))
+
+
+async def chapter_job(llm, csv_path, job):
+    """Long form: compact, chapter (single, windowed or local boundaries + titles), save"""
+    video_id, df, fingerprint = await asyncio.to_thread(long_form.load_subtitles, csv_path)
+    if df is None:
+        raise ValueError("missing or empty CSV")
+    job['video_id'] = video_id
+
+    if long_form.chaptering_mode == "local":
+        script = await asyncio.to_thread(long_form.local_chapter_script, df)
+        llm_output = await llm.chat(long_form.chapter_messages(script, long_form.local_system_prompt),
+                                    chapter_output_tokens, job, temperature=0.0)
+        if not await asyncio.to_thread(long_form.finish_chapters, llm_output, df, video_id, fingerprint):
+            raise ValueError("no chapters parsed from llm output")
+        return
+
+    script, _, tokens_after, window_sec = long_form.compact_transcript(df)
+
+    if long_form.use_windowed(tokens_after):
+        windows = long_form.window_scripts(df, window_sec)
+        outputs = await asyncio.gather(
+            *[
+                llm.chat(long_form.chapter_messages(s, long_form.window_prompt(own_start)),
+                         chapter_output_tokens, job, temperature=0.0)
+                for own_start, _, _, s in windows
+            ],
+            return_exceptions=True,
+        )
+        if all(isinstance(o, Exception) for o in outputs):
+            raise outputs[0]
+        llm_output = long_form.merge_window_chapters(
+            [(*window[:3], None if isinstance(o, Exception) else o) for window, o in zip(windows, outputs)]
+        )
+    else:
+        llm_output = await llm.chat(long_form.chapter_messages(script), chapter_output_tokens, job, temperature=0.0)
+
+    if not await asyncio.to_thread(long_form.finish_chapters, llm_output, df, video_id, fingerprint):
+        raise ValueError("no chapters parsed from llm output")
+
+
+async def title_job(llm, csv_path, job):
+    """Short form: title, save"""
+    video_id, script_text, fingerprint = await asyncio.to_thread(short_form.load_script, csv_path)
+    if script_text is None:
+        raise ValueError("missing or empty CSV")
+    job['video_id'] = video_id
+
+    title = await llm.chat(short_form.title_messages(script_text), title_output_tokens, job, temperature=0.0)
+    await asyncio.to_thread(short_form.save_title, title, script_text, video_id)
+    short_form.mark_processed(video_id, fingerprint)
+
+
+async def run_jobs(jobs, n_concurrent, rpm, tpm):
+    """Run (kind, csv_path) jobs, return per-video accounting"""
+    llm = AsyncLLM(RateLimiter(rpm, tpm))
+    semaphore = asyncio.Semaphore(n_concurrent)
+    handlers = {'chapters': chapter_job, 'title': title_job}
+
+    async def run_one(kind, csv_path):
+        job = {'kind': kind, 'csv_path': csv_path, 'video_id': None, 'ok': False, 'error': None, 'attempts': 0}
+        async with semaphore:
+            start = time.time()
+            try:
+                await handlers[kind](llm, csv_path, job)
+                job['ok'] = True
+                print(f"✅ {kind} {job['video_id']}")
+            except Exception as e:
+                job['error'] = f"{type(e).__name__}: {e}"
+                print(f"❌ {kind} {job['video_id'] or csv_path}: {job['error']}")
+            job['seconds'] = round(time.time() - start, 2)
+        return job
+
+    results = await asyncio.gather(*[run_one(kind, path) for kind, path in jobs])
+    print(f"Requests: {llm.requests}, retries: {llm.retries}")
+    print(llm.cache.stats())
+    return results
+
+
+def collect_jobs(do_long, do_short):
+    jobs = []
+    if do_long:
+        csv_files = subtitle_source.file_names("long_form", long_form.input_csv_folder)
+        for csv_file in long_form.find_unprocessed_files(csv_files):
+            jobs.append(('chapters', os.path.join(long_form.input_csv_folder, csv_file)))
+    if do_short:
+        csv_files = subtitle_source.file_names("short_form", short_form.input_csv_folder)
+        for csv_file in short_form.find_unprocessed_files(csv_files):
+            jobs.append(('title', os.path.join(short_form.input_csv_folder, csv_file)))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent chapter/title generation")
+    parser.add_argument("--long", action="store_true", help="only long form chapters")
+    parser.add_argument("--short", action="store_true", help="only short form titles")
+    parser.add_argument("--concurrency", type=int, default=concurrency)
+    parser.add_argument("--rpm", type=int, default=requests_per_minute)
+    parser.add_argument("--tpm", type=int, default=tokens_per_minute)
+    args = parser.parse_args()
+
+    do_long, do_short = (args.long or not args.short), (args.short or not args.long)
+    jobs = collect_jobs(do_long, do_short)
+    if not jobs:
+        print("✅ Nothing to process!")
+        return True
+
+    print(f"Found {len(jobs)} jobs")
+    start = time.time()
+    results = asyncio.run(run_jobs(jobs, args.concurrency, args.rpm, args.tpm))
+
+    success_count = sum(1 for r in results if r['ok'])
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'='*50}")
+    print(f"✅ Processing complete: {success_count}/{len(jobs)} videos in {time.time() - start:.1f}s")
+    print(f"Report saved to {report_path}")
+    return success_count == len(jobs)
+
+
+if __name__ == "__main__":
+    main()
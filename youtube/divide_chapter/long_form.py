@@ -2,22 +2,87 @@
 Preprocess dog data using GPT4o
 """
 import pandas as pd
+import numpy as np
 import os
 import re
 import zipfile
 import openai
 import json
 import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import sys
 sys.path.append('/home/jiyoon/Pethroom')
 from credentials import OPENAI_API_KEY
+import llm_cache
+import state_store
+import corpus_store
+import boundary_detector
+import subtitle_source
 
 
 # --- Config ---
 openai.api_key = OPENAI_API_KEY
 input_csv_folder = "/data2/jiyoon/Pethroom/whisper/subtitles/csv/long_form"
 root_output_path = "/data2/jiyoon/Pethroom/data/chapters/long_form"
+write_txt_files = False      # chapters go to corpus_store; True also writes the titles/chunks txt layout
+
+# LLM input compaction
+llm_window_sec = 20          # segments merged per "[HH:MM:SS] text" line (0 = one line per segment)
+llm_max_window_sec = 120     # widest window tried while fitting the token budget
+llm_token_budget = 30000     # input tokens allowed for the script
+
+# Windowed (map-reduce) chaptering, used when the compacted script still exceeds llm_token_budget
+chaptering_mode = "auto"     # "auto", "single", "windowed" or "local" (see below)
+map_window_sec = 1800        # length of each window sent to the LLM
+map_overlap_sec = 180        # overlap between neighbouring windows
+map_workers = 4              # windows requested concurrently
+seam_merge_sec = 90          # boundaries of two windows this close to each other and to their seam are duplicates
+
+chapter_system_prompt = (
+    "당신은 동영상 스크립트의 내용을 분석하여 논리적인 챕터(장)를 나누고 제목을 생성하는 전문가입니다. "
+    "사용자가 제공하는 스크립트와 타임스탬프 정보를 바탕으로, 영상의 내용 흐름이 바뀌는 지점을 정확하게 포착하세요. "
+    "응답은 반드시 '00:00:00 챕터 제목' 형식의 텍스트 리스트로만 구성되어야 합니다. "
+    "어떤 설명이나 머리말, 꼬리말도 붙이지 마세요. 항상 00:00:00 부터 시작해야 합니다. "
+    "챕터 제목은 25자 이내로 명확하게 요약해야 합니다."
+)
+
+# Local chaptering: boundary_detector.py finds the chapters, the LLM only titles an excerpt of each
+local_excerpt_chars = 300    # characters of each section shown to the LLM
+
+local_system_prompt = (
+    "당신은 동영상의 각 챕터(장)에 제목을 붙이는 전문가입니다. "
+    "사용자가 챕터별 시작 시간과 내용 일부를 '[00:00:00] 내용' 형식으로 제공합니다. "
+    "응답은 반드시 '00:00:00 챕터 제목' 형식의 텍스트 리스트로만 구성되어야 하며, 주어진 챕터마다 한 줄씩 주어진 시간을 그대로 사용하세요. "
+    "어떤 설명이나 머리말, 꼬리말도 붙이지 마세요. "
+    "챕터 제목은 25자 이내로 명확하게 요약해야 합니다."
+)
+
+# First window of a long video
+window_system_prompt = (
+    "당신은 동영상 스크립트의 내용을 분석하여 논리적인 챕터(장)를 나누고 제목을 생성하는 전문가입니다. "
+    "사용자가 제공하는 스크립트는 긴 영상의 첫 구간입니다. 타임스탬프 정보를 바탕으로, 영상의 내용 흐름이 바뀌는 지점을 정확하게 포착하세요. "
+    "응답은 반드시 '00:00:00 챕터 제목' 형식의 텍스트 리스트로만 구성되어야 합니다. "
+    "어떤 설명이나 머리말, 꼬리말도 붙이지 마세요. 타임스탬프는 스크립트에 적힌 시간을 그대로 사용하고, 항상 00:00:00 부터 시작해야 합니다. "
+    "챕터 제목은 25자 이내로 명확하게 요약해야 합니다."
+)
+
+# Every later window: it continues an earlier chapter, so only real topic changes are wanted
+window_continue_prompt = (
+    "당신은 동영상 스크립트의 내용을 분석하여 논리적인 챕터(장)를 나누고 제목을 생성하는 전문가입니다. "
+    "사용자가 제공하는 스크립트는 긴 영상의 중간 구간이며, 첫 부분은 앞 구간에서 이어지는 내용입니다. "
+    "타임스탬프 정보를 바탕으로, 새로운 주제가 실제로 시작되는 지점만 포착하세요. 스크립트의 첫 타임스탬프에 챕터를 만들지 마세요. "
+    "응답은 반드시 '00:00:00 챕터 제목' 형식의 텍스트 리스트로만 구성되어야 하며, 새로운 주제가 없으면 빈 응답을 주세요. "
+    "어떤 설명이나 머리말, 꼬리말도 붙이지 마세요. 타임스탬프는 스크립트에 적힌 시간을 그대로 사용하세요. "
+    "챕터 제목은 25자 이내로 명확하게 요약해야 합니다."
+)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o tokenizer
+except ImportError:
+    _encoding = None
 
 # --- Utils ---
 def format_time_to_hms(seconds):
@@ -32,32 +97,80 @@ def format_time_to_hms(seconds):
     return f"{hours:02d}:{minutes:02d}:{remaining_seconds:02d}"
 
 
-def generate_chapters_with_llm(script):
+def count_tokens(text):
     """
-    Generate llm output
+    Count gpt-4o tokens (rough estimate if tiktoken isn't installed)
     """
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 2  # Korean averages ~2 chars per token
 
-    print("Processing text ...")
 
-    system_prompt = (
-        "당신은 동영상 스크립트의 내용을 분석하여 논리적인 챕터(장)를 나누고 제목을 생성하는 전문가입니다. "
-        "사용자가 제공하는 스크립트와 타임스탬프 정보를 바탕으로, 영상의 내용 흐름이 바뀌는 지점을 정확하게 포착하세요. "
-        "응답은 반드시 '00:00:00 챕터 제목' 형식의 텍스트 리스트로만 구성되어야 합니다. "
-        "어떤 설명이나 머리말, 꼬리말도 붙이지 마세요. 항상 00:00:00 부터 시작해야 합니다. "
-        "챕터 제목은 25자 이내로 명확하게 요약해야 합니다."
+def build_llm_script(df, window_sec=0):
+    """
+    Build "[HH:MM:SS] text" lines, merging segments into window_sec windows
+    Each line keeps the start of its first segment, so chapter times still map onto real segment starts
+    """
+    text = df['text'].fillna('').astype(str).str.strip()
+
+    if window_sec and window_sec > 0:
+        window = (df['start'] // window_sec).astype(int)
+        grouped = pd.DataFrame({'start': df['start'], 'text': text, 'window': window}).groupby('window', sort=True)
+        starts = grouped['start'].first()
+        text = grouped['text'].agg(lambda parts: " ".join(p for p in parts if p))
+    else:
+        starts = df['start']
+
+    seconds = starts.astype(int)
+    hms = (
+        (seconds // 3600).astype(str).str.zfill(2) + ":"
+        + ((seconds % 3600) // 60).astype(str).str.zfill(2) + ":"
+        + (seconds % 60).astype(str).str.zfill(2)
     )
+    return "\n".join(("[" + hms + "] " + text).tolist())
+
+
+def compact_transcript(df):
+    """
+    Widen the merge window until the script fits llm_token_budget
+    Returns (script, tokens before, tokens after, window used)
+    """
+    tokens_before = count_tokens(build_llm_script(df))
+
+    window_sec = llm_window_sec
+    script = build_llm_script(df, window_sec)
+    tokens_after = count_tokens(script)
+    while tokens_after > llm_token_budget and 0 < window_sec < llm_max_window_sec:
+        window_sec = min(window_sec * 2, llm_max_window_sec)
+        script = build_llm_script(df, window_sec)
+        tokens_after = count_tokens(script)
+
+    return script, tokens_before, tokens_after, window_sec
+
+
+def chapter_messages(script, system_prompt=chapter_system_prompt):
+    """
+    Chat messages asking for chapters of a script
+    """
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"다음 동영상 스크립트를 분석하여 챕터를 생성해 주세요:\n\n{script}"}
+    ]
+
+
+def generate_chapters_with_llm(script, system_prompt=chapter_system_prompt):
+    """
+    Generate llm output
+    """
+
+    print("Processing text ...")
 
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o", 
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"다음 동영상 스크립트를 분석하여 챕터를 생성해 주세요:\n\n{script}"}
-            ],
+        llm_output = llm_cache.chat(
+            model="gpt-4o",
+            messages=chapter_messages(script, system_prompt),
             temperature=0.0
         )
-
-        llm_output = response.choices[0].message.content.strip()
         print("Done")
         return llm_output
 
@@ -69,76 +182,249 @@ def generate_chapters_with_llm(script):
         return None
 
 
-def parse_llm_chapters(llm_output):
+def hms_to_seconds(time_str):
     """
-    Post process llm output
+    Convert HH:MM:SS to seconds
+    """
+    return sum(x * int(t) for x, t in zip([3600, 60, 1], time_str.split(':')))
+
+
+def parse_chapter_lines(llm_output):
+    """
+    Read 'HH:MM:SS title' lines from llm output
     """
     chapters_data = []
 
     # Search for 'HH:MM:SS title' format
     pattern = re.compile(r'(\d{1,2}:\d{2}:\d{2})\s+(.+)')
 
-
     # Post process llm output format
     for line in llm_output.split('\n'):
         match = pattern.match(line.strip())
         if match:
-            start_time_str = match.group(1).strip() # time
-            title = match.group(2).strip() # title
-
             chapters_data.append({
-                'start_time': start_time_str,
-                'title': title
+                'start_time': match.group(1).strip(), # time
+                'title': match.group(2).strip() # title
             })
 
-    # Chunk text to chapters
-    final_chapters = []
+    return chapters_data
 
-    for i, chapter in enumerate(chapters_data):
-        # Convert time to seconds fmt
-        start_time_seconds = sum(x * int(t) for x, t in zip([3600, 60, 1], chapter['start_time'].split(':')))
 
-        # Find the start time for chapter
-        start_index = df[df['start'] >= start_time_seconds].index.min()
-        if pd.isna(start_index):
-            start_index = 0 # Fall to 0 if start time wasn't found or 00:00:00 
+def segment_arrays(df):
+    """
+    Segment starts as a float array and texts as a list (None for missing text)
+    """
+    starts = df['start'].to_numpy(dtype=float)
+    texts = [str(t) if not pd.isna(t) else None for t in df['text'].tolist()]
+    return starts, texts
 
-        
-        if i + 1 < len(chapters_data):
-            next_chapter_time_seconds = sum(x * int(t) for x, t in zip([3600, 60, 1], chapters_data[i+1]['start_time'].split(':')))
-            end_index = df[df['start'] >= next_chapter_time_seconds].index.min()
-        else:
-            end_index = len(df) 
 
+def split_into_windows(df, window_sec=map_window_sec, overlap_sec=map_overlap_sec):
+    """
+    Overlapping time windows over the transcript
+    Returns [(own_start, own_end, window df)], own_* is the part no other window owns
+    """
+    total = float(df['start'].max())
+    step = window_sec - overlap_sec
+    windows = []
+    own_start = 0.0
+    while own_start <= total:
+        own_end = own_start + step
+        lo, hi = own_start - overlap_sec / 2, own_end + overlap_sec / 2
+        window_df = df[(df['start'] >= lo) & (df['start'] < hi)]
+        if not window_df.empty:
+            windows.append((own_start, own_end, window_df))
+        own_start = own_end
+    return windows
+
+
+def window_scripts(df, window_sec):
+    """
+    [(own_start, own_end, first_sec, script)] for every map window
+    first_sec is the whole second of the script's first timestamp
+    """
+    return [
+        (own_start, own_end, int(window_df['start'].min()), build_llm_script(window_df, window_sec))
+        for own_start, own_end, window_df in split_into_windows(df)
+    ]
 
-        chapter_chunk = df.iloc[start_index:end_index]
 
-        if not chapter_chunk.empty:
-            final_chapters.append({
-                'start_time': chapter['start_time'],
-                'title': chapter['title'],
-                'text': " ".join(chapter_chunk['text'].dropna().astype(str).tolist()),
-                'start_sec': chapter_chunk.iloc[0]['start']
-            })
+def window_prompt(own_start):
+    """
+    System prompt of one map window: only the first one starts at 00:00:00
+    """
+    return window_system_prompt if own_start == 0 else window_continue_prompt
+
+
+def local_chapter_script(df):
+    """
+    "[HH:MM:SS] excerpt" line for every section found by boundary_detector
+    """
+    starts, texts = segment_arrays(df)
+    boundaries = boundary_detector.detect_boundaries(starts, texts)
+    bounds = np.searchsorted(starts, boundaries, side='left')
+    ends = np.append(bounds[1:], len(starts))
+
+    lines = []
+    for start_index, end_index in zip(bounds, ends):
+        text = " ".join(t.strip() for t in texts[start_index:end_index] if t)
+        lines.append(f"[{format_time_to_hms(starts[start_index])}] {text[:local_excerpt_chars]}")
+    return "\n".join(lines)
+
+
+def generate_chapters_local(df):
+    """
+    Local boundaries, one LLM call for the titles
+    """
+    script = local_chapter_script(df)
+    print(f"Local chaptering: {len(script.splitlines())} sections, {count_tokens(script)} tokens")
+    return generate_chapters_with_llm(script, local_system_prompt)
+
+
+def use_windowed(tokens_after):
+    """
+    Whether a script of tokens_after tokens goes through map-reduce chaptering
+    """
+    return chaptering_mode == "windowed" or (
+        chaptering_mode == "auto" and tokens_after > llm_token_budget
+    )
+
+
+def merge_window_chapters(window_outputs):
+    """
+    Reduce step over [(own_start, own_end, first_sec, llm_output)]
+    - each window's chapters are kept inside its own range (+- seam_merge_sec), as the LLM gave them;
+      a later window's chapter at its first timestamp is dropped (no context to call it a new topic)
+    - at every seam, chapters of the left and right window within seam_merge_sec of the seam and
+      of each other are paired one to one (closest first) as the same boundary seen twice; of each
+      pair the one inside its own window's range is kept
+    Returns 'HH:MM:SS title' text in the single-call llm output format
+    """
+    by_window = {}
+    for own_start, own_end, first_sec, llm_output in window_outputs:
+        chapters = by_window.setdefault(own_start, [])
+        if not llm_output:
+            continue
+        for chapter in parse_chapter_lines(llm_output):
+            seconds = hms_to_seconds(chapter['start_time'])
+            if own_start > 0 and seconds <= first_sec:
+                continue
+            if own_start - seam_merge_sec <= seconds < own_end + seam_merge_sec:
+                owned = own_start <= seconds < own_end
+                chapters.append((seconds, chapter['title'], owned))
+
+    dropped = set()
+    for own_start, own_end, _, _ in window_outputs:
+        left = [c for c in by_window[own_start] if abs(c[0] - own_end) < seam_merge_sec]
+        right = [c for c in by_window.get(own_end, []) if abs(c[0] - own_end) < seam_merge_sec]
+        pairs = sorted(
+            ((abs(l[0] - r[0]), l, r) for l in left for r in right if abs(l[0] - r[0]) < seam_merge_sec),
+            key=lambda pair: pair[0],
+        )
+        paired = set()
+        for _, l, r in pairs:
+            if l in paired or r in paired:
+                continue
+            paired.update((l, r))
+            dropped.add(l if r[2] and not l[2] else r)
+
+    merged = sorted(
+        (seconds, title) for chapters in by_window.values()
+        for seconds, title, owned in chapters if (seconds, title, owned) not in dropped
+    )
+
+    if merged:
+        merged[0] = (0, merged[0][1])  # always start at 00:00:00
+
+    return "\n".join(f"{format_time_to_hms(seconds)} {title}" for seconds, title in merged)
+
+
+def generate_chapters_windowed(df, window_sec):
+    """
+    Map step: request chapters for every window concurrently
+    window_sec is the compaction window used for each window's script
+    """
+    windows = window_scripts(df, window_sec)
+    print(f"Windowed chaptering: {len(windows)} windows")
+
+    def run(window):
+        own_start, own_end, first_sec, script = window
+        return own_start, own_end, first_sec, generate_chapters_with_llm(script, window_prompt(own_start))
+
+    with ThreadPoolExecutor(max_workers=map_workers) as executor:
+        window_outputs = list(executor.map(run, windows))
+
+    failed = sum(1 for *_, output in window_outputs if output is None)
+    if failed == len(window_outputs):
+        return None
+    if failed:
+        print(f"⚠️  {failed}/{len(window_outputs)} windows failed, merging the rest")
+
+    return merge_window_chapters(window_outputs)
+
+
+def parse_llm_chapters(llm_output, starts, texts):
+    """
+    Post process llm output
+    - starts : sorted segment start times, texts : segment texts
+    Chapter boundaries are the first segment starting at/after each chapter time
+    """
+    chapters_data = parse_chapter_lines(llm_output)
+    if not chapters_data:
+        return []
+
+    # Find the start index of every chapter at once
+    chapter_seconds = np.array([hms_to_seconds(ch['start_time']) for ch in chapters_data], dtype=float)
+    bounds = np.searchsorted(starts, chapter_seconds, side='left')
+    ends = np.append(bounds[1:], len(starts))
+
+    # Chunk text to chapters
+    final_chapters = []
+    for chapter, start_index, end_index in zip(chapters_data, bounds, ends):
+        if start_index >= end_index:
+            continue
+
+        final_chapters.append({
+            'start_time': chapter['start_time'],
+            'title': chapter['title'],
+            'text': " ".join(t for t in texts[start_index:end_index] if t is not None),
+            'start_sec': float(starts[start_index])
+        })
 
     return final_chapters
 
 
+def prompt_version():
+    """
+    Hash of everything that changes the chapters for the same CSV
+    """
+    parts = [
+        "gpt-4o", chapter_system_prompt, window_system_prompt, window_continue_prompt, llm_window_sec, llm_max_window_sec,
+        llm_token_budget, chaptering_mode, map_window_sec, map_overlap_sec, seam_merge_sec,
+    ]
+    if chaptering_mode == "local":
+        parts += [local_system_prompt, local_excerpt_chars, *boundary_detector.params()]
+    return state_store.version_hash(*parts)
+
+
 def save_chapters_to_files(chapters, video_id, root_path):
-    video_dir = os.path.join(root_path, video_id)
+    """
+    Write titles + chunks into a fresh directory, then swap it in for the old one
+    so chapters from a previous run never mix with the new ones
+    """
+    final_dir = os.path.join(root_path, video_id)
+    video_dir = os.path.join(root_path, f".{video_id}.tmp-{os.getpid()}")
     chunks_dir = os.path.join(video_dir, "chunks")
-    
-    os.makedirs(video_dir, exist_ok=True)
+
+    shutil.rmtree(video_dir, ignore_errors=True)
     os.makedirs(chunks_dir, exist_ok=True)
-    
-    # Save chapter titles in titles_<video_id>.txt 
+
+    # Save chapter titles in titles_<video_id>.txt
     youtube_chapter_list_path = os.path.join(video_dir, f"titles_{video_id}.txt")
     with open(youtube_chapter_list_path, 'w', encoding='utf-8') as f_yt:
         for ch in chapters:
             f_yt.write(f"{ch['start_time']} {ch['title']}\n")
 
-    print(f"YouTube chapters list saved in: {youtube_chapter_list_path}")
-
     # Save each chapters in txt files
     for ch in chapters:
         # Create file name based on title
@@ -148,84 +434,136 @@ def save_chapters_to_files(chapters, video_id, root_path):
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(ch['text'])
 
-    print(f"Chapter content files saved in: {chunks_dir}")
+    # Swap the new directory in
+    old_dir = None
+    if os.path.exists(final_dir):
+        old_dir = os.path.join(root_path, f".{video_id}.old-{os.getpid()}")
+        os.rename(final_dir, old_dir)
+    os.rename(video_dir, final_dir)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    youtube_chapter_list_path = os.path.join(final_dir, f"titles_{video_id}.txt")
+    print(f"YouTube chapters list saved in: {youtube_chapter_list_path}")
+    print(f"Chapter content files saved in: {os.path.join(final_dir, 'chunks')}")
     return youtube_chapter_list_path
 
 
+def save_chapters(chapters, video_id):
+    """
+    Append the chapters to the corpus store (and the txt layout if write_txt_files)
+    """
+    generation = corpus_store.get_store().append(video_id, "long_form", chapters)
+    print(f"Chapters stored in corpus: {video_id} (generation {generation})")
+    if write_txt_files:
+        save_chapters_to_files(chapters, video_id, root_output_path)
+
+
+def load_subtitles(csv_file_path):
+    """
+    Load the subtitles of a video from the segment store, or its CSV (subtitle_source.py)
+    Returns (video_id, df, fingerprint), df is None if the video is missing or empty
+    fingerprint is the state store fingerprint of the rows df was built from
+    """
+    video_id, df, fingerprint = subtitle_source.load(csv_file_path)
+    if df is None:
+        return None, None, None
+    if df.empty:
+        print(f"❌ Subtitles of {video_id} contain no data.")
+        return video_id, None, fingerprint
+
+    return video_id, df, fingerprint
+
+
+def finish_chapters(llm_output, df, video_id, fingerprint=None):
+    """
+    Parse llm output into chapters and save them
+    With the fingerprint from load_subtitles, the video is recorded as done in the state store
+    """
+    if not llm_output:
+        print(f"\n❌ Failed to generate chapters with LLM for {video_id}")
+        return False
+
+    starts, texts = segment_arrays(df)
+    chapters = parse_llm_chapters(llm_output, starts, texts)
+
+    if not chapters:
+        print(f"\n❌ Failed to create chapters for {video_id}")
+        return False
+
+    print("\n--- Final chapters list ---")
+    for ch in chapters:
+        print(f"{ch['start_time']} {ch['title']}")
+
+    # Save chapters
+    save_chapters(chapters, video_id)
+    if fingerprint:
+        state_store.get_store().mark_done("long_form", video_id, fingerprint, prompt_version())
+    print(f"✅ Processing complete for {video_id}")
+    return True
+
+
 def process_single_csv(csv_file_path):
     """Process a single CSV file"""
-    global df 
-    
-    if not os.path.exists(csv_file_path):
-        print(f"❌ CSV file not found: {csv_file_path}")
+    video_id, df, fingerprint = load_subtitles(csv_file_path)
+    if df is None:
         return False
-    
-    # Extract video ID from filename
-    video_id = os.path.basename(csv_file_path).replace('subtitle_', '').replace('.csv', '')
     print(f"Processing Video ID: {video_id}")
-    
-    # Load CSV data
-    df = pd.read_csv(csv_file_path)
-    if df.empty:
-        print(f"❌ CSV file {csv_file_path} contains no data.")
-        return False
-    
-    # Prepare script for LLM
-    script_lines = []
-    for idx, row in df.iterrows():
-        start_time_str = format_time_to_hms(row['start'])
-        # "[HH:MM:SS] text" format 
-        line = f"[{start_time_str}] {row['text']}"
-        script_lines.append(line)
-    llm_input_script = "\n".join(script_lines)
+
+    if chaptering_mode == "local":
+        return finish_chapters(generate_chapters_local(df), df, video_id, fingerprint)
+
+    # Prepare script for LLM, "[HH:MM:SS] text" format
+    llm_input_script, tokens_before, tokens_after, window_sec = compact_transcript(df)
+    print(f"LLM input: {tokens_before} -> {tokens_after} tokens ({window_sec}s windows)")
 
     # Generate chapters with LLM
-    llm_output = generate_chapters_with_llm(llm_input_script)
-    
-    if llm_output:
-        chapters = parse_llm_chapters(llm_output)
-        
-        if chapters:
-            print("\n--- Final chapters list ---")
-            for ch in chapters:
-                print(f"{ch['start_time']} {ch['title']}")
-            
-            # Save chapters to files
-            save_chapters_to_files(chapters, video_id, root_output_path)
-            print(f"✅ Processing complete for {video_id}")
-            return True
-        else:
-            print(f"\n❌ Failed to create chapters for {video_id}")
-            return False
+    if use_windowed(tokens_after):
+        llm_output = generate_chapters_windowed(df, window_sec)
     else:
-        print(f"\n❌ Failed to generate chapters with LLM for {video_id}")
-        return False
+        llm_output = generate_chapters_with_llm(llm_input_script)
+
+    return finish_chapters(llm_output, df, video_id, fingerprint)
+
+
+def find_unprocessed_files(csv_files):
+    """
+    Subtitle files (csv or segment store) that are new, changed, or were chaptered with another prompt version
+    Outputs from before the state store existed are adopted as current
+    """
+    store = state_store.get_store()
+    version = prompt_version()
+    unprocessed_files = []
+    skipped = 0
+    for csv_file in csv_files:
+        video_id = csv_file.replace('subtitle_', '').replace('.csv', '')
+        csv_path = os.path.join(input_csv_folder, csv_file)
+        titles_file = os.path.join(root_output_path, video_id, f"titles_{video_id}.txt")
+
+        if not store.known("long_form", video_id) and os.path.exists(titles_file):
+            store.mark_done("long_form", video_id, subtitle_source.fingerprint(csv_path), version)
+
+        if subtitle_source.is_current("long_form", video_id, csv_path, version):
+            skipped += 1
+        else:
+            unprocessed_files.append(csv_file)
+
+    if skipped:
+        print(f"⏭️  Skipping {skipped} already processed videos")
+    return unprocessed_files
 
 
 def main():
-    """Process all CSV files in the input folder"""
-    if not os.path.exists(input_csv_folder):
-        print(f"❌ Input folder not found: {input_csv_folder}")
-        return False
-    
-    # Find all CSV files in the folder
-    csv_files = [f for f in os.listdir(input_csv_folder) if f.endswith('.csv')]
+    """Process all long form videos in the segment store and the input folder"""
+    # Store videos are named like their CSV files
+    csv_files = subtitle_source.file_names("long_form", input_csv_folder)
     
     if not csv_files:
-        print(f"❌ No CSV files found in {input_csv_folder}")
+        print(f"❌ No subtitles found in the segment store or {input_csv_folder}")
         return False
     
     # Filter out already processed files
-    unprocessed_files = []
-    for csv_file in csv_files:
-        video_id = csv_file.replace('subtitle_', '').replace('.csv', '')
-        output_dir = os.path.join(root_output_path, video_id)
-        titles_file = os.path.join(output_dir, f"titles_{video_id}.txt")
-        
-        if os.path.exists(titles_file):
-            print(f"⏭️  Skipping already processed: {video_id}")
-        else:
-            unprocessed_files.append(csv_file)
+    unprocessed_files = find_unprocessed_files(csv_files)
     
     if not unprocessed_files:
         print("✅ All files have already been processed!")
@@ -241,6 +579,7 @@ def main():
             success_count += 1
     
     print(f"\n{'='*50}")
+    print(llm_cache.get_cache().stats())
     print(f"✅ Processing complete: {success_count}/{len(unprocessed_files)} files processed successfully")
     return success_count == len(unprocessed_files)
 
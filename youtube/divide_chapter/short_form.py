@@ -6,42 +6,141 @@ import os
 import re
 import openai
 import time
+import json
+import glob
 
 import sys
 sys.path.append('/home/jiyoon/Pethroom')
 from credentials import OPENAI_API_KEY
+import llm_cache
+from long_form import count_tokens
+import state_store
+import corpus_store
+import subtitle_source
 
 
 # --- Config ---
 openai.api_key = OPENAI_API_KEY
 input_csv_folder = "/data2/jiyoon/Pethroom/whisper/subtitles/csv/short_form"
 root_output_path = "/data2/jiyoon/Pethroom/data/chapters/short_form"
+write_txt_files = False      # titles go to corpus_store; True also writes <video_id>_0.0_<title>.txt
+
+title_system_prompt = (
+    "당신은 동영상 스크립트의 내용을 분석하여 제목을 생성하는 전문가입니다. "
+    "사용자가 제공하는 스크립트를 바탕으로, 영상의 핵심 내용을 담은 짧고 제목을 생성하세요. "
+    "제목은 15자 이내로 간결하게 작성하세요."
+    "제목만 반환하고 다른 설명은 포함하지 마세요."
+)
+
+# Packed mode: many short scripts per request, answered as {video_id: title} JSON
+packed_mode = True
+pack_token_budget = 6000     # script tokens per packed request
+pack_max_items = 40
+title_max_chars = 30         # longer answers are treated as malformed
+
+pack_system_prompt = (
+    "당신은 동영상 스크립트의 내용을 분석하여 제목을 생성하는 전문가입니다. "
+    "사용자가 여러 개의 동영상 스크립트를 video_id와 함께 제공합니다. "
+    "각 스크립트마다 영상의 핵심 내용을 담은 짧은 제목을 15자 이내로 생성하세요. "
+    "응답은 반드시 {\"video_id\": \"제목\"} 형식의 JSON 객체 하나여야 하며, 모든 video_id를 포함해야 합니다. "
+    "다른 설명은 포함하지 마세요."
+)
 
 # --- Utils ---
+def title_messages(script):
+    """
+    Chat messages asking for the title of a script
+    """
+    return [
+        {"role": "system", "content": title_system_prompt},
+        {"role": "user", "content": f"다음 동영상 스크립트를 분석하여 제목을 생성해 주세요:\n\n{script}"}
+    ]
+
+
+def pack_scripts(items):
+    """
+    Group (video_id, script) items into packs that fit pack_token_budget
+    A script larger than the budget gets a pack of its own
+    """
+    packs, pack, pack_tokens = [], [], 0
+    for video_id, script in items:
+        tokens = count_tokens(script)
+        if pack and (pack_tokens + tokens > pack_token_budget or len(pack) >= pack_max_items):
+            packs.append(pack)
+            pack, pack_tokens = [], 0
+        pack.append((video_id, script))
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def packed_messages(pack):
+    """
+    Chat messages asking for the titles of every script in a pack
+    """
+    scripts = json.dumps([{"video_id": video_id, "script": script} for video_id, script in pack], ensure_ascii=False)
+    return [
+        {"role": "system", "content": pack_system_prompt},
+        {"role": "user", "content": f"다음 동영상 스크립트들을 분석하여 각각 제목을 생성해 주세요:\n\n{scripts}"}
+    ]
+
+
+def parse_packed_titles(llm_output, video_ids):
+    """
+    Keep only well formed titles for the requested IDs
+    """
+    try:
+        data = json.loads(llm_output)
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    titles = {}
+    for video_id in video_ids:
+        title = data.get(video_id)
+        if isinstance(title, str) and title.strip() and len(title.strip()) <= title_max_chars:
+            titles[video_id] = title.strip()
+    return titles
+
+
+def generate_titles_packed(pack):
+    """
+    Generate titles for a pack of short form videos in one request
+    Returns {video_id: title} for the IDs that came back valid
+    """
+    print(f"Generating {len(pack)} titles in one request...")
+
+    try:
+        llm_output = llm_cache.chat(
+            model="gpt-4o",
+            messages=packed_messages(pack),
+            temperature=0.0,
+            response_format={"type": "json_object"}
+        )
+    except openai.AuthenticationError:
+        print("\n❌ Invalid OpenAI API key")
+        return {}
+    except Exception as e:
+        print(f"\n❌ Error : {e}")
+        return {}
+
+    return parse_packed_titles(llm_output, [video_id for video_id, _ in pack])
+
+
 def generate_title_with_llm(script):
     """
     Generate title for short form video
     """
     print("Generating title...")
 
-    system_prompt = (
-        "당신은 동영상 스크립트의 내용을 분석하여 제목을 생성하는 전문가입니다. "
-        "사용자가 제공하는 스크립트를 바탕으로, 영상의 핵심 내용을 담은 짧고 제목을 생성하세요. "
-        "제목은 15자 이내로 간결하게 작성하세요."
-        "제목만 반환하고 다른 설명은 포함하지 마세요."
-    )
-
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o", 
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"다음 동영상 스크립트를 분석하여 제목을 생성해 주세요:\n\n{script}"}
-            ],
+        llm_output = llm_cache.chat(
+            model="gpt-4o",
+            messages=title_messages(script),
             temperature=0.0
         )
-
-        llm_output = response.choices[0].message.content.strip()
         print("Title generated successfully")
         return llm_output
 
@@ -53,8 +152,42 @@ def generate_title_with_llm(script):
         return None
 
 
+def prompt_version():
+    """Hash of everything that changes the title for the same CSV"""
+    return state_store.version_hash("gpt-4o", title_system_prompt, pack_system_prompt, packed_mode)
+
+
+def existing_title_files(video_id, output_path=root_output_path):
+    return glob.glob(os.path.join(glob.escape(output_path), f"{glob.escape(video_id)}_0.0_*.txt"))
+
+
+def find_unprocessed_files(csv_files):
+    """
+    Subtitle files (csv or segment store) that are new, changed, or were titled with another prompt version
+    Outputs from before the state store existed are adopted as current
+    """
+    store = state_store.get_store()
+    version = prompt_version()
+    unprocessed_files = []
+    for csv_file in csv_files:
+        video_id = csv_file.replace('subtitle_', '').replace('.csv', '')
+        csv_path = os.path.join(input_csv_folder, csv_file)
+
+        if not store.known("short_form", video_id) and existing_title_files(video_id):
+            store.mark_done("short_form", video_id, subtitle_source.fingerprint(csv_path), version)
+
+        if not subtitle_source.is_current("short_form", video_id, csv_path, version):
+            unprocessed_files.append(csv_file)
+    return unprocessed_files
+
+
+def mark_processed(video_id, fingerprint):
+    """Record a titled video with the fingerprint load_script returned"""
+    state_store.get_store().mark_done("short_form", video_id, fingerprint, prompt_version())
+
+
 def save_content_to_file(title, subtitle_text, video_id, output_path):
-    """Save generated title and subtitle content to file"""
+    """Save generated title and subtitle content to file, replacing older titles of the video"""
     os.makedirs(output_path, exist_ok=True)
     
     # Create safe filename from title
@@ -64,42 +197,61 @@ def save_content_to_file(title, subtitle_text, video_id, output_path):
     file_name = f"{video_id}_0.0_{safe_title}.txt"
     file_path = os.path.join(output_path, file_name)
     
-    # Save the subtitle text as content
-    with open(file_path, 'w', encoding='utf-8') as f:
+    # Save the subtitle text as content (tmp + rename, then drop stale titles)
+    tmp_path = os.path.join(output_path, f".{video_id}.tmp-{os.getpid()}")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         f.write(subtitle_text)
+    os.replace(tmp_path, file_path)
+    for old_path in existing_title_files(video_id, output_path):
+        if old_path != file_path:
+            os.remove(old_path)
     
     print(f"Content saved: {file_path}")
     return file_path
 
 
+def save_title(title, subtitle_text, video_id):
+    """Append the title and script to the corpus store (and a txt file if write_txt_files)"""
+    chapter = {'start_time': "00:00:00", 'start_sec': 0.0, 'title': title, 'text': subtitle_text}
+    corpus_store.get_store().append(video_id, "short_form", [chapter])
+    print(f"Title stored in corpus: {video_id}")
+    if write_txt_files:
+        save_content_to_file(title, subtitle_text, video_id, root_output_path)
+
+
+def load_script(csv_file_path):
+    """
+    Load the subtitles of a video (segment store, or its CSV) as one script
+    Returns (video_id, script_text, fingerprint), script_text is None if the video is missing or empty
+    fingerprint is the state store fingerprint of the rows the script was built from
+    """
+    video_id, df, fingerprint = subtitle_source.load(csv_file_path)
+    if df is None:
+        return None, None, None
+    if df.empty:
+        print(f"❌ Subtitles of {video_id} contain no data.")
+        return video_id, None, fingerprint
+
+    # Prepare script for LLM (combine all text)
+    return video_id, " ".join(df['text'].dropna().astype(str).tolist()), fingerprint
+
+
 def process_single_csv(csv_file_path):
     """Process a single CSV file to generate title"""
-    
-    if not os.path.exists(csv_file_path):
-        print(f"❌ CSV file not found: {csv_file_path}")
+    video_id, script_text, fingerprint = load_script(csv_file_path)
+    if script_text is None:
         return False
-    
-    # Extract video ID from filename
-    video_id = os.path.basename(csv_file_path).replace('subtitle_', '').replace('.csv', '')
     print(f"Processing Video ID: {video_id}")
     
-    # Load CSV data
-    df = pd.read_csv(csv_file_path)
-    if df.empty:
-        print(f"❌ CSV file {csv_file_path} contains no data.")
-        return False
-    
-    # Prepare script for LLM (combine all text)
-    script_text = " ".join(df['text'].tolist())
-    
     # Generate title with LLM
     generated_title = generate_title_with_llm(script_text)
     
     if generated_title:
         print(f"Generated title: {generated_title}")
         
-        # Save content to file with generated title as filename
-        save_content_to_file(generated_title, script_text, video_id, root_output_path)
+        # Save title and script
+        save_title(generated_title, script_text, video_id)
+        mark_processed(video_id, fingerprint)
         print(f"✅ Processing complete for {video_id}")
         return True
     else:
@@ -107,31 +259,82 @@ def process_single_csv(csv_file_path):
         return False
 
 
+def process_packed(csv_paths):
+    """
+    Title every CSV through packed requests, falling back to one request per missing/malformed ID
+    Returns the number of videos processed successfully
+    """
+    items, fingerprints = [], {}
+    for csv_path in csv_paths:
+        video_id, script_text, fingerprint = load_script(csv_path)
+        if script_text is not None:
+            items.append((video_id, script_text))
+            fingerprints[video_id] = fingerprint
+
+    packs = pack_scripts(items)
+    requests = len(packs)
+    prompt_tokens = 0
+    success_count = 0
+
+    for pack in packs:
+        print(f"\n{'='*50}")
+        titles = generate_titles_packed(pack)
+        prompt_tokens += sum(count_tokens(m['content']) for m in packed_messages(pack))
+
+        for video_id, script_text in pack:
+            title = titles.get(video_id)
+            if title is None:
+                print(f"↩️  Falling back to a single request for {video_id}")
+                title = generate_title_with_llm(script_text)
+                requests += 1
+                prompt_tokens += sum(count_tokens(m['content']) for m in title_messages(script_text))
+            if not title:
+                print(f"❌ Failed to generate title for {video_id}")
+                continue
+
+            save_title(title, script_text, video_id)
+            mark_processed(video_id, fingerprints[video_id])
+            success_count += 1
+
+    print(f"\n{'='*50}")
+    print(f"Packed {len(items)} videos into {len(packs)} requests "
+          f"({requests} with fallbacks, {len(items) - requests} requests saved)")
+    if success_count:
+        print(f"~{prompt_tokens // success_count} prompt tokens per title")
+    return success_count
+
+
 def main():
-    """Process all CSV files in the input folder"""
-    if not os.path.exists(input_csv_folder):
-        print(f"❌ Input folder not found: {input_csv_folder}")
-        return False
-    
-    # Find all CSV files in the folder
-    csv_files = [f for f in os.listdir(input_csv_folder) if f.endswith('.csv')]
+    """Process all short form videos in the segment store and the input folder"""
+    # Store videos are named like their CSV files
+    csv_files = subtitle_source.file_names("short_form", input_csv_folder)
     
     if not csv_files:
-        print(f"❌ No CSV files found in {input_csv_folder}")
+        print(f"❌ No subtitles found in the segment store or {input_csv_folder}")
         return False
     
-    print(f"Found {len(csv_files)} CSV files to process")
-    
+    # Filter out files whose CSV and prompt haven't changed
+    unprocessed_files = find_unprocessed_files(csv_files)
+    if not unprocessed_files:
+        print("✅ All files have already been processed!")
+        return True
+
+    print(f"Found {len(csv_files)} total CSV files, {len(unprocessed_files)} remaining to process")
+
     success_count = 0
-    for csv_file in csv_files:
-        csv_path = os.path.join(input_csv_folder, csv_file)
-        print(f"\n{'='*50}")
-        if process_single_csv(csv_path):
-            success_count += 1
+    if packed_mode:
+        success_count = process_packed([os.path.join(input_csv_folder, f) for f in unprocessed_files])
+    else:
+        for csv_file in unprocessed_files:
+            csv_path = os.path.join(input_csv_folder, csv_file)
+            print(f"\n{'='*50}")
+            if process_single_csv(csv_path):
+                success_count += 1
     
     print(f"\n{'='*50}")
-    print(f"✅ Processing complete: {success_count}/{len(csv_files)} files processed successfully")
-    return success_count == len(csv_files)
+    print(llm_cache.get_cache().stats())
+    print(f"✅ Processing complete: {success_count}/{len(unprocessed_files)} files processed successfully")
+    return success_count == len(unprocessed_files)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,235 @@
+"""
+Generate **short form** titles through the OpenAI Batch API
+- prepare : write every pending title request to a JSONL batch file
+- submit  : upload the file and create the batch job
+- status  : poll the batch until it finishes
+- collect : map results back by video ID into the corpus store
+- run     : all of the above, resuming whatever step the last run stopped at
+Progress lives in batch_state.json, so a half-finished batch is picked up again.
+Point OPENAI_BASE_URL at fake_openai_server.py to run it offline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import openai
+
+import llm_cache
+import short_form
+import subtitle_source
+
+# --- Config ---
+model = "gpt-4o"
+batch_dir = "/data2/jiyoon/Pethroom/data/batch/short_form"
+state_path = os.path.join(batch_dir, "batch_state.json")
+poll_interval_sec = 60
+max_requests_per_batch = 50000  # Batch API limit per file
+
+finished_statuses = ("completed", "failed", "expired", "cancelled")
+
+
+# --- Utils ---
+def load_state():
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    """Write state atomically so an interrupted run never leaves half a file"""
+    os.makedirs(batch_dir, exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def batch_request(video_id, script_text):
+    return {
+        'custom_id': video_id,
+        'method': 'POST',
+        'url': '/v1/chat/completions',
+        'body': {'model': model, 'messages': short_form.title_messages(script_text), 'temperature': 0.0},
+    }
+
+
+def get_client():
+    return openai.OpenAI(api_key=openai.api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+
+
+# --- Steps ---
+def prepare(state):
+    """Write pending requests to a JSONL file; cache hits are saved right away"""
+    csv_files = subtitle_source.file_names("short_form", short_form.input_csv_folder)
+    csv_files = short_form.find_unprocessed_files(csv_files)
+    cache = llm_cache.get_cache()
+    os.makedirs(batch_dir, exist_ok=True)
+
+    jsonl_path = os.path.join(batch_dir, f"titles_{int(time.time())}.jsonl")
+    video_ids = []
+    fingerprints = {}
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        for csv_file in csv_files:
+            csv_path = os.path.join(short_form.input_csv_folder, csv_file)
+            video_id, script_text, fingerprint = short_form.load_script(csv_path)
+            if script_text is None:
+                continue
+
+            request = batch_request(video_id, script_text)
+            cached = None if llm_cache.bypass else cache.get(
+                llm_cache.LLMCache.make_key(model, request['body']['messages'], {'temperature': 0.0})
+            )
+            if cached is not None:
+                short_form.save_title(cached, script_text, video_id)
+                short_form.mark_processed(video_id, fingerprint)
+                continue
+
+            f.write(json.dumps(request, ensure_ascii=False) + '\n')
+            video_ids.append(video_id)
+            fingerprints[video_id] = fingerprint
+            if len(video_ids) >= max_requests_per_batch:
+                break
+
+    if not video_ids:
+        os.remove(jsonl_path)
+        print("✅ No pending short form videos")
+        return state
+
+    # Fingerprints of the scripts as sent: a CSV changed before collect is titled again next batch
+    state.update({'jsonl_path': jsonl_path, 'video_ids': video_ids, 'fingerprints': fingerprints, 'collected': [],
+                  'batch_id': None, 'status': 'prepared'})
+    save_state(state)
+    print(f"Batch file with {len(video_ids)} requests: {jsonl_path}")
+    return state
+
+
+def submit(state, client):
+    """Upload the JSONL file and create the batch"""
+    with open(state['jsonl_path'], 'rb') as f:
+        input_file = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+    )
+    state.update({'input_file_id': input_file.id, 'batch_id': batch.id, 'status': batch.status})
+    save_state(state)
+    print(f"Submitted batch {batch.id}")
+    return state
+
+
+def poll(state, client, wait=True):
+    """Refresh batch status, optionally until it is finished"""
+    while True:
+        batch = client.batches.retrieve(state['batch_id'])
+        counts = batch.request_counts
+        state.update({'status': batch.status, 'output_file_id': batch.output_file_id,
+                      'error_file_id': batch.error_file_id})
+        save_state(state)
+        progress = f" ({counts.completed}/{counts.total})" if counts else ""
+        print(f"Batch {batch.id}: {batch.status}{progress}")
+
+        if batch.status in finished_statuses or not wait:
+            return state
+        time.sleep(poll_interval_sec)
+
+
+def collect(state, client):
+    """Save titles of a finished batch; already collected IDs are skipped"""
+    if not state.get('output_file_id'):
+        print(f"❌ Batch {state['batch_id']} has no output ({state['status']})")
+        if state['status'] in finished_statuses:
+            state['status'] = 'collected'  # requests go into the next batch
+            save_state(state)
+        return state
+
+    collected = set(state.get('collected', []))
+    cache = llm_cache.get_cache()
+    success_count = 0
+
+    for line in client.files.content(state['output_file_id']).text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        video_id = result['custom_id']
+        if video_id in collected:
+            continue
+
+        response = result.get('response') or {}
+        if result.get('error') or response.get('status_code') != 200:
+            print(f"❌ {video_id}: {result.get('error') or response.get('status_code')}")
+            continue
+
+        title = response['body']['choices'][0]['message']['content'].strip()
+        csv_path = os.path.join(short_form.input_csv_folder, f"subtitle_{video_id}.csv")
+        _, script_text, fingerprint = short_form.load_script(csv_path)
+        if script_text is None:
+            continue
+        fingerprint = state.get('fingerprints', {}).get(video_id, fingerprint)
+
+        short_form.save_title(title, script_text, video_id)
+        short_form.mark_processed(video_id, fingerprint)
+        cache.put(
+            llm_cache.LLMCache.make_key(model, short_form.title_messages(script_text), {'temperature': 0.0}),
+            model, title,
+        )
+        collected.add(video_id)
+        state['collected'] = sorted(collected)
+        save_state(state)
+        success_count += 1
+
+    missing = len(state['video_ids']) - len(collected)
+    print(f"✅ Collected {success_count} titles, {missing} left for the next batch")
+    state['status'] = 'collected'
+    save_state(state)
+    return state
+
+
+def run(state, client):
+    """Resume from wherever the state file says we are"""
+    if not state or state.get('status') in ('collected', None):
+        state = prepare({})
+        if not state:
+            return state
+    if not state.get('batch_id'):
+        state = submit(state, client)
+    if state['status'] not in finished_statuses:
+        state = poll(state, client)
+    return collect(state, client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Short form titles through the OpenAI Batch API")
+    parser.add_argument("step", choices=["prepare", "submit", "status", "collect", "run"], nargs="?", default="run")
+    args = parser.parse_args()
+
+    state = load_state()
+    client = get_client()
+
+    if args.step == "prepare":
+        if state.get('status') not in ('collected', None):
+            print(f"⏭️  Batch already in progress ({state['status']}), use 'run' to resume")
+        else:
+            prepare({})
+    elif args.step == "submit":
+        if state.get('status') != 'prepared':
+            print("❌ Nothing prepared to submit")
+            sys.exit(1)
+        submit(state, client)
+    elif args.step in ("status", "collect"):
+        if not state.get('batch_id') or state.get('status') == 'collected':
+            print("❌ No batch in progress")
+            sys.exit(1)
+        state = poll(state, client, wait=False)
+        if args.step == "collect":
+            collect(state, client)
+    else:
+        run(state, client)
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Shared processing state for long_form.py / short_form.py
+- one row per (kind, video_id) : sha256 of the input CSV and the prompt/model version
+- a video is redone only when its CSV or the prompt version changed
+- size + mtime short-circuit the hashing, so unchanged runs stay instant
+  (segment store inputs use row count + written_at, see subtitle_source.py)
+- the fingerprint recorded by mark_done is the one taken when the input was loaded
+  (read_fingerprinted), so a CSV rewritten during the LLM call is picked up next run
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+# --- Config ---
+state_path = "/data2/jiyoon/Pethroom/data/chapters/state.sqlite"
+
+
+def version_hash(*parts):
+    """Short hash of everything that changes the LLM output (prompts, model, params)"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode('utf-8')).hexdigest()[:16]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_fingerprinted(path):
+    """File bytes and the (input_hash, size, mtime) fingerprint of exactly those bytes"""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    return data, (hashlib.sha256(data).hexdigest(), len(data), stat.st_mtime)
+
+
+def file_fingerprint(path):
+    return read_fingerprinted(path)[1]
+
+
+class StateStore:
+    """Thread safe (kind, video_id) -> fingerprint table"""
+
+    def __init__(self, path=state_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed (
+                kind       TEXT,
+                video_id   TEXT,
+                input_hash TEXT,
+                version    TEXT,
+                size       INTEGER,
+                mtime      REAL,
+                updated_at REAL,
+                PRIMARY KEY (kind, video_id)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _row(self, kind, video_id):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT input_hash, version, size, mtime FROM processed WHERE kind = ? AND video_id = ?",
+                (kind, video_id),
+            ).fetchone()
+
+    def known(self, kind, video_id):
+        return self._row(kind, video_id) is not None
+
+    def is_current(self, kind, video_id, version, size, mtime, content_hash):
+        """
+        True if video_id was processed from this exact input with this prompt version
+        size / mtime : of the input now, content_hash : callable, only called when they changed
+        """
+        row = self._row(kind, video_id)
+        if row is None or row[1] != version:
+            return False
+        if row[2] == size and row[3] == mtime:
+            return True
+        if row[0] != content_hash():
+            return False
+        # Same content rewritten (e.g. a re-export): remember the new size / mtime
+        with self.lock:
+            self.conn.execute(
+                "UPDATE processed SET size = ?, mtime = ? WHERE kind = ? AND video_id = ?",
+                (size, mtime, kind, video_id),
+            )
+            self.conn.commit()
+        return True
+
+    def mark_done(self, kind, video_id, fingerprint, version):
+        """fingerprint : (input_hash, size, mtime) of the input the output was made from"""
+        input_hash, size, mtime = fingerprint
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, video_id, input_hash, version, size, mtime, time.time()),
+            )
+            self.conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+        return _store
@@ -0,0 +1,125 @@
+"""
+Subtitle input of long_form.py / short_form.py
+- the whisper segment store (whisper/segment_store.py) first, subtitle_<id>.csv in the
+  input folder as the fallback (videos transcribed before the store, or by other tools)
+- every input is named by its csv path, input folder + subtitle_<id>.csv, whether the file exists or not
+- store videos go to long or short form by the crawl index (whisper/crawl_urls.py),
+  by duration if the index doesn't know them
+- a store video's fingerprint hashes the csv segment_store.export_legacy would write, so moving
+  a video between the csv and the store doesn't count as a change
+"""
+import os
+import io
+import sqlite3
+import hashlib
+
+import pandas as pd
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whisper'))
+import crawl_urls
+import state_store
+try:
+    import segment_store
+except ImportError:  # no pyarrow: csv only
+    segment_store = None
+
+# --- Config ---
+use_segment_store = True
+
+_store_videos = None
+
+
+# --- Utils ---
+def video_id_of(path):
+    return os.path.basename(path).replace('subtitle_', '').replace('.csv', '')
+
+
+def store_enabled():
+    return use_segment_store and segment_store is not None
+
+
+def store_videos(refresh=False):
+    """{video_id: {'rows', 'written_at', 'duration'}} of the segment store, cached until refresh"""
+    global _store_videos
+    if _store_videos is None or refresh:
+        _store_videos = segment_store.video_info() if store_enabled() else {}
+    return _store_videos
+
+
+def crawled_is_short():
+    """{video_id: is_short} from the crawl index, empty if there is none"""
+    if not os.path.exists(crawl_urls.index_path):
+        return {}
+    conn = sqlite3.connect(f"file:{crawl_urls.index_path}?mode=ro", uri=True)
+    try:
+        return {video_id: bool(is_short) for video_id, is_short in conn.execute("SELECT video_id, is_short FROM videos")}
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+
+def file_names(kind, folder):
+    """subtitle_<id>.csv names of one kind ("long_form" / "short_form"): csv files in folder plus store videos"""
+    names = set()
+    if os.path.isdir(folder):
+        names.update(f for f in os.listdir(folder) if f.endswith('.csv'))
+
+    videos = store_videos(refresh=True)
+    if videos:
+        is_short = crawled_is_short()
+        for video_id, info in videos.items():
+            short = is_short.get(video_id)
+            if short is None:
+                short = info['duration'] is not None and info['duration'] <= crawl_urls.short_max_duration
+            if short == (kind == "short_form"):
+                names.add(f"subtitle_{video_id}.csv")
+    return sorted(names)
+
+
+def store_fingerprint(df):
+    """(input_hash, size, mtime) of store rows: hash of the exported csv, row count, written_at"""
+    rows = df[['start', 'end', 'text']].values.tolist()
+    data = segment_store.csv_text(rows).encode('utf-8')
+    return hashlib.sha256(data).hexdigest(), len(rows), float(df['written_at'].max())
+
+
+def load(path):
+    """
+    Subtitles of the video named by path
+    Returns (video_id, df, fingerprint), df is None if neither the store nor the csv has the video
+    fingerprint is the state store fingerprint of exactly the rows in df
+    """
+    video_id = video_id_of(path)
+    if store_enabled():
+        df = segment_store.read_video(video_id, columns=['start', 'end', 'text', 'written_at'])
+        if not df.empty:
+            return video_id, df[['start', 'end', 'text']], store_fingerprint(df)
+
+    if not os.path.exists(path):
+        print(f"❌ Subtitles not found: {path}")
+        return None, None, None
+
+    # Hashed from the same bytes, so a rewrite during the LLM call isn't recorded as done
+    data, fingerprint = state_store.read_fingerprinted(path)
+    return video_id, pd.read_csv(io.BytesIO(data)), fingerprint
+
+
+def fingerprint(path):
+    return load(path)[2]
+
+
+def is_current(kind, video_id, path, version):
+    """state_store is_current for a store video or csv; only hashes when size / mtime differ"""
+    info = store_videos().get(video_id)
+    if info is not None:
+        return state_store.get_store().is_current(
+            kind, video_id, version, info['rows'], info['written_at'], lambda: fingerprint(path)[0]
+        )
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    return state_store.get_store().is_current(
+        kind, video_id, version, stat.st_size, stat.st_mtime, lambda: state_store.file_hash(path)
+    )
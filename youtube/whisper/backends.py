@@ -0,0 +1,74 @@
+"""
+Transcription backends with one segment schema
+- openai  : openai-whisper (fp32 on CPU)
+- faster  : faster-whisper / CTranslate2 (int8 on CPU by default)
+Every backend returns a list of dicts with at least id, start, end, text
+"""
+
+BACKENDS = ("openai", "faster")
+
+
+class OpenAIWhisperBackend:
+    """openai-whisper, the original setup"""
+
+    def __init__(self, model_name="medium", n_threads=None, device="cpu"):
+        import torch
+        import whisper
+
+        if n_threads:
+            torch.set_num_threads(n_threads)
+        self.device = device
+        self.model = whisper.load_model(model_name, device=device)
+        self.label = backend_label("openai", model_name)
+
+    def transcribe(self, audio, language="ko"):
+        result = self.model.transcribe(
+            audio, language=language, word_timestamps=False, fp16=(self.device != "cpu")
+        )
+        return result['segments']
+
+
+class FasterWhisperBackend:
+    """CTranslate2 whisper, quantized weights"""
+
+    def __init__(self, model_name="medium", n_threads=None, compute_type="int8", device="cpu"):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(
+            model_name, device=device, compute_type=compute_type, cpu_threads=n_threads or 0
+        )
+        self.label = backend_label("faster", model_name, compute_type)
+
+    def transcribe(self, audio, language="ko"):
+        segments, _ = self.model.transcribe(audio, language=language, word_timestamps=False)
+        return [
+            {
+                'id': seg.id,
+                'seek': seg.seek,
+                'start': seg.start,
+                'end': seg.end,
+                'text': seg.text,
+                'tokens': list(seg.tokens),
+                'temperature': seg.temperature,
+                'avg_logprob': seg.avg_logprob,
+                'compression_ratio': seg.compression_ratio,
+                'no_speech_prob': seg.no_speech_prob,
+            }
+            for seg in segments
+        ]
+
+
+def backend_label(kind, model_name, compute_type="int8"):
+    """Name recorded in the manifest, 'medium' for the original setup"""
+    if kind == "openai":
+        return model_name
+    return f"faster-whisper:{model_name}:{compute_type}"
+
+
+def load_backend(kind, model_name, n_threads=None, compute_type="int8"):
+    """Create a backend by name"""
+    if kind == "openai":
+        return OpenAIWhisperBackend(model_name, n_threads)
+    if kind == "faster":
+        return FasterWhisperBackend(model_name, n_threads, compute_type)
+    raise ValueError(f"Unknown backend '{kind}', expected one of {BACKENDS}")
@@ -0,0 +1,149 @@
+"""
+Benchmark transcription backends on local Korean clips
+- input : folder of audio clips, each with a reference <clip>.txt next to it
+- output : csv with real-time factor, peak RSS, WER and CER per backend/model
+Each setting runs in a fresh process so peak RSS belongs to that setting only
+"""
+
+import os
+import re
+import csv
+import time
+import resource
+import multiprocessing as mp
+
+import backends
+
+# --- Config ---
+clips_dir = "/data2/jiyoon/Pethroom/benchmark/clips"
+output_csv_path = "/data2/jiyoon/Pethroom/benchmark/backend_results.csv"
+audio_exts = ('.wav', '.mp3', '.m4a', '.flac')
+n_threads = 8
+
+# (backend, model, compute type)
+settings = [
+    ("openai", "small", "float32"),
+    ("openai", "medium", "float32"),
+    ("faster", "small", "int8"),
+    ("faster", "medium", "int8"),
+    ("faster", "large-v3", "int8"),
+]
+
+
+# --- Utils ---
+def edit_distance(ref, hyp):
+    """Levenshtein distance between two token lists"""
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def normalize_text(text):
+    """Drop punctuation and collapse spaces before scoring"""
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def error_rates(reference, hypothesis):
+    """Return (WER, CER); CER ignores spaces, which Korean spacing makes noisy"""
+    ref, hyp = normalize_text(reference), normalize_text(hypothesis)
+    ref_words, hyp_words = ref.split(), hyp.split()
+    ref_chars, hyp_chars = list(ref.replace(' ', '')), list(hyp.replace(' ', ''))
+    wer = edit_distance(ref_words, hyp_words) / max(len(ref_words), 1)
+    cer = edit_distance(ref_chars, hyp_chars) / max(len(ref_chars), 1)
+    return wer, cer
+
+
+def load_clips():
+    """[(audio path, reference text)] for every clip with a reference"""
+    clips = []
+    for file_name in sorted(os.listdir(clips_dir)):
+        base, ext = os.path.splitext(file_name)
+        ref_path = os.path.join(clips_dir, base + '.txt')
+        if ext.lower() in audio_exts and os.path.exists(ref_path):
+            with open(ref_path, 'r', encoding='utf-8') as f:
+                clips.append((os.path.join(clips_dir, file_name), f.read()))
+    return clips
+
+
+def run_setting(setting, clips, result_queue):
+    """Child process: load one backend, transcribe every clip, report metrics"""
+    from transcribe_videos import decode_audio, SAMPLE_RATE
+
+    kind, model_name, compute_type = setting
+    load_start = time.time()
+    model = backends.load_backend(kind, model_name, n_threads, compute_type)
+    load_sec = time.time() - load_start
+
+    audio_sec = transcribe_sec = 0.0
+    errors = []
+    for audio_path, reference in clips:
+        audio = decode_audio(audio_path)
+        audio_sec += len(audio) / SAMPLE_RATE
+
+        start = time.time()
+        segments = model.transcribe(audio, language="ko")
+        transcribe_sec += time.time() - start
+
+        errors.append(error_rates(reference, " ".join(seg['text'] for seg in segments)))
+
+    result_queue.put({
+        'backend': kind,
+        'model': model_name,
+        'compute_type': compute_type,
+        'load_sec': round(load_sec, 2),
+        'audio_sec': round(audio_sec, 2),
+        'transcribe_sec': round(transcribe_sec, 2),
+        'rtf': round(transcribe_sec / max(audio_sec, 1e-9), 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'wer': round(sum(w for w, _ in errors) / len(errors), 4),
+        'cer': round(sum(c for _, c in errors) / len(errors), 4),
+    })
+
+
+def main():
+    clips = load_clips()
+    if not clips:
+        print(f"❌ No clips with reference transcripts found in {clips_dir}")
+        return False
+
+    print(f"Found {len(clips)} clips")
+
+    ctx = mp.get_context("spawn")
+    rows = []
+    for setting in settings:
+        print(f"\n{'='*50}")
+        print(f"Running {backends.backend_label(*setting)}")
+
+        result_queue = ctx.Queue()
+        proc = ctx.Process(target=run_setting, args=(setting, clips, result_queue))
+        proc.start()
+        proc.join()
+
+        if proc.exitcode != 0 or result_queue.empty():
+            print(f"❌ Failed: {backends.backend_label(*setting)}")
+            continue
+
+        row = result_queue.get()
+        rows.append(row)
+        print(f"RTF {row['rtf']}  RSS {row['peak_rss_mb']} MB  WER {row['wer']}  CER {row['cer']}")
+
+    if not rows:
+        return False
+
+    os.makedirs(os.path.dirname(output_csv_path), exist_ok=True)
+    with open(output_csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\nResults saved to {output_csv_path}")
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Split long audio into chunks for parallel whisper and stitch the results
+- split points are picked at the quietest frame near each target boundary
+- every chunk runs `overlap_sec` past its boundary so no word gets cut
+- stitching shifts segments to absolute time and drops the overlap duplicates
+"""
+
+import re
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SEC = 0.03  # energy frame for silence search
+
+
+def frame_energy(audio):
+    """RMS energy per FRAME_SEC frame"""
+    frame = int(SAMPLE_RATE * FRAME_SEC)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def find_split_points(audio, chunk_sec=300, search_sec=20):
+    """
+    Sample indices to cut at, roughly every chunk_sec seconds
+    Each cut moves to the quietest frame within +-search_sec of the target
+    """
+    total_sec = len(audio) / SAMPLE_RATE
+    if total_sec <= chunk_sec * 1.5:
+        return []
+
+    energy = frame_energy(audio)
+    frame = int(SAMPLE_RATE * FRAME_SEC)
+    splits = []
+
+    target = chunk_sec
+    while target < total_sec - chunk_sec / 2:
+        lo = max(int((target - search_sec) / FRAME_SEC), 0)
+        hi = min(int((target + search_sec) / FRAME_SEC), len(energy))
+        if hi <= lo:
+            break
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        splits.append(quietest * frame)
+        target = quietest * FRAME_SEC + chunk_sec
+
+    return splits
+
+
+def make_chunks(audio, splits, overlap_sec=2.0):
+    """
+    Cut audio at the split points
+    Returns [(offset_sec, own_end_sec, samples)], samples run overlap_sec past own_end_sec
+    """
+    overlap = int(overlap_sec * SAMPLE_RATE)
+    bounds = [0] + list(splits) + [len(audio)]
+    chunks = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        samples = audio[start:min(end + overlap, len(audio))]
+        chunks.append((start / SAMPLE_RATE, end / SAMPLE_RATE, samples))
+    return chunks
+
+
+def shift_segments(segments, offset_sec):
+    """Move chunk-relative segments to absolute time"""
+    shifted = []
+    for seg in segments:
+        seg = dict(seg)
+        seg['start'] = round(seg['start'] + offset_sec, 3)
+        seg['end'] = round(seg['end'] + offset_sec, 3)
+        if 'seek' in seg:
+            seg['seek'] = seg['seek'] + int(offset_sec * 100)  # mel frames
+        shifted.append(seg)
+    return shifted
+
+
+def _normalize(text):
+    return re.sub(r'[\s\W_]+', '', text)
+
+
+def stitch_segments(chunk_results, tolerance_sec=0.5):
+    """
+    Join [(own_end_sec, absolute segments)] from consecutive chunks
+    - a chunk's segments starting past its own end belong to the next chunk
+    - the next chunk's segments already covered by the previous one are dropped
+    """
+    stitched = []
+    for own_end, segments in chunk_results:
+        prev_end = stitched[-1]['end'] if stitched else 0.0
+        prev_text = _normalize(stitched[-1]['text']) if stitched else ""
+
+        for seg in segments:
+            if seg['start'] >= own_end:
+                break
+            if seg['start'] < prev_end - tolerance_sec:
+                continue
+            text = _normalize(seg['text'])
+            if text and prev_text and text in prev_text and seg['start'] < prev_end + tolerance_sec:
+                continue
+            stitched.append(seg)
+
+    for i, seg in enumerate(stitched):
+        seg['id'] = i
+    return stitched
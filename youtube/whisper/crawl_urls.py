@@ -1,38 +1,200 @@
 """
-Codes for crawling every urls from a youtube channel
-- input : channel url
-- output : txt file 
+Codes for crawling every urls from youtube channels
+- input : channel urls
+- output : txt files (all / long form / short form urls)
+
+Crawls are incremental: every video is kept in a SQLite index with its
+duration, (approximate) upload date and a shorts flag, and a channel tab stops being paged
+once it reaches ids that are already known (newest videos come first).
+A tab whose last crawl failed part way is walked to the end on the next run,
+so the videos behind the failure are not hidden by that early stop.
+Channels are crawled concurrently.
 """
 
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
 import subprocess
-import json
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Config ---
-file_path = '/data2/jiyoon/Pethroom/video_urls.txt'  
-channel_url = "https://www.youtube.com/@yoonsem_dog"
+file_path = '/data2/jiyoon/Pethroom/video_urls.txt'
+long_form_file_path = '/data2/jiyoon/Pethroom/video_urls_long.txt'
+short_form_file_path = '/data2/jiyoon/Pethroom/video_urls_short.txt'
+index_path = '/data2/jiyoon/Pethroom/channel_index.sqlite'
+channel_urls = [
+    "https://www.youtube.com/@yoonsem_dog",
+]
+
+tabs = {"videos": False, "shorts": True}  # channel tab -> shorts flag
+stop_after_known = 5                       # consecutive known ids before a tab stops paging
+short_max_duration = 60                    # seconds, for videos whose tab doesn't tell
+crawl_workers = 4
+
+print_template = "%(id)s\t%(duration)s\t%(upload_date)s\t%(url)s"
+
+
+# --- Utils ---
+def open_index(path):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id    TEXT PRIMARY KEY,
+            channel     TEXT,
+            url         TEXT,
+            duration    REAL,
+            upload_date TEXT,
+            is_short    INTEGER,
+            first_seen  REAL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tabs (
+            channel    TEXT,
+            tab        TEXT,
+            complete   INTEGER,
+            crawled_at REAL,
+            PRIMARY KEY (channel, tab)
+        )
+        """
+    )
+    conn.commit()
+    return conn
+
+
+def known_ids(conn):
+    return {row[0] for row in conn.execute("SELECT video_id FROM videos")}
+
+
+def complete_tabs(conn):
+    """(channel, tab) pairs whose last crawl reached the end or the already indexed part"""
+    return {(row[0], row[1]) for row in conn.execute("SELECT channel, tab FROM tabs WHERE complete = 1")}
+
+
+def parse_line(line):
+    """One `print_template` line -> dict, None for malformed lines"""
+    parts = line.rstrip('\n').split('\t')
+    if len(parts) != 4 or not parts[0]:
+        return None
+    video_id, duration, upload_date, url = parts
+    return {
+        'video_id': video_id,
+        'duration': float(duration) if duration not in ('NA', 'None', '') else None,
+        'upload_date': upload_date if upload_date not in ('NA', 'None', '') else None,
+        'url': url,
+    }
+
+
+def crawl_tab(channel_url, tab, known, full=False):
+    """
+    List a channel tab newest first, stop once `stop_after_known` known ids in a row are seen
+    Returns (new video dicts, yt-dlp error message or None)
+    """
+    # Flat tab listings have no upload_date; approximate_date derives one from "3 weeks ago"
+    command = ['yt-dlp', '--flat-playlist', '--lazy-playlist', '--ignore-errors',
+               '--extractor-args', 'youtubetab:approximate_date',
+               '--print', print_template, f"{channel_url.rstrip('/')}/{tab}"]
+    # stderr goes to a file so a chatty yt-dlp can't block on a full pipe while stdout is read
+    stderr_file = tempfile.TemporaryFile(mode='w+')
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+
+    new_videos = []
+    known_streak = 0
+    stopped = False
+    for line in proc.stdout:
+        video = parse_line(line)
+        if video is None:
+            continue
+        if video['video_id'] in known:
+            known_streak += 1
+            if not full and known_streak >= stop_after_known:
+                stopped = True
+                break
+            continue
+        known_streak = 0
+        video['channel'] = channel_url
+        video['is_short'] = tabs[tab] or (
+            video['duration'] is not None and video['duration'] <= short_max_duration
+        )
+        new_videos.append(video)
+
+    if stopped and proc.poll() is None:
+        proc.terminate()  # stop paging, the rest is already indexed
+    proc.wait()
+    proc.stdout.close()
+
+    error = None
+    if proc.returncode != 0 and not stopped:
+        stderr_file.seek(0)
+        error = stderr_file.read().strip() or f"yt-dlp exited with {proc.returncode}"
+    stderr_file.close()
+    return new_videos, error
+
+
+def write_url_list(path, urls):
+    with open(path, 'w') as f:
+        for url in urls:
+            f.write(url + '\n')
+
 
+def export_work_lists(conn):
+    """Write all / long form / short form url lists from the index"""
+    rows = conn.execute(
+        "SELECT url, is_short FROM videos ORDER BY upload_date DESC, first_seen DESC"
+    ).fetchall()
+    write_url_list(file_path, [url for url, _ in rows])
+    write_url_list(long_form_file_path, [url for url, is_short in rows if not is_short])
+    write_url_list(short_form_file_path, [url for url, is_short in rows if is_short])
+    return len(rows)
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally crawl youtube channels")
+    parser.add_argument("channels", nargs="*", default=channel_urls)
+    parser.add_argument("--full", action="store_true", help="walk every tab to the end")
+    args = parser.parse_args()
 
-def get_channel_urls(channel_url):  
-    command = ['yt-dlp', '--flat-playlist', '--print', 'url', channel_url]
-    result = subprocess.run(command, capture_output=True, text=True)
-    
-    if result.returncode == 0:
-        urls = result.stdout.strip().split('\n')
-        return [url for url in urls if url]  # Filter out empty lines
-    else:
-        print(f"Error: {result.stderr}")
-        return []
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    conn = open_index(index_path)
+    known = known_ids(conn)
+    start = time.time()
 
+    complete = complete_tabs(conn)
+    jobs = [(channel, tab) for channel in args.channels for tab in tabs]
+    with ThreadPoolExecutor(max_workers=crawl_workers) as executor:
+        results = list(executor.map(
+            lambda job: crawl_tab(*job, known, args.full or job not in complete), jobs
+        ))
 
+    new_count = 0
+    now = time.time()
+    for (channel, tab), (videos, error) in zip(jobs, results):
+        if error:
+            print(f"Error: {channel}/{tab}: {error} (walked to the end next run)")
+        print(f"{channel}/{tab}: {len(videos)} new videos")
+        conn.execute(
+            "INSERT OR REPLACE INTO tabs VALUES (?, ?, ?, ?)", (channel, tab, int(error is None), now)
+        )
+        for video in videos:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (video['video_id'], video['channel'], video['url'], video['duration'],
+                 video['upload_date'], int(video['is_short']), now),
+            )
+            new_count += cursor.rowcount
+    conn.commit()
 
-video_urls = get_channel_urls(channel_url)
-print(f"Found {len(video_urls)} videos")
+    total = export_work_lists(conn)
+    conn.close()
 
+    print(f"Found {new_count} new videos, {total} in index ({time.time() - start:.1f}s)")
+    print(f"URLs saved to: {file_path}, {long_form_file_path}, {short_form_file_path}")
 
-with open(file_path, 'w') as f:
-    for url in video_urls:
-        f.write(url + '\n')
 
-print(f"URLs saved to: {file_path}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
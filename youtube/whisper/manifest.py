@@ -0,0 +1,75 @@
+"""
+SQLite manifest of transcription progress
+- one row per video ID : state, whisper model, last error
+- lets transcribe_videos.py resume and skip finished videos
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+DOWNLOADED = "downloaded"
+TRANSCRIBED = "transcribed"
+FAILED = "failed"
+
+
+class Manifest:
+    """Thread safe wrapper around the manifest table"""
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id   TEXT PRIMARY KEY,
+                url        TEXT,
+                state      TEXT NOT NULL,
+                model      TEXT,
+                error      TEXT,
+                updated_at REAL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def mark(self, video_id, state, url=None, model=None, error=None):
+        """Upsert the state of one video, keeping url/model if not given"""
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO videos (video_id, url, state, model, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    url = COALESCE(excluded.url, videos.url),
+                    state = excluded.state,
+                    model = COALESCE(excluded.model, videos.model),
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+                """,
+                (video_id, url, state, model, error, time.time()),
+            )
+            self.conn.commit()
+
+    def get(self, video_id):
+        """Return {'state', 'model', 'error'} or None for unknown videos"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT state, model, error FROM videos WHERE video_id = ?", (video_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'state': row[0], 'model': row[1], 'error': row[2]}
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM videos GROUP BY state").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,234 @@
+"""
+Columnar store for whisper segments, replacing subtitle_<id>.csv + indented json
+- one Parquet dataset: video_id, segment_index, start, end, text and the other whisper segment
+  fields (seek, tokens, temperature, avg_logprob, compression_ratio, no_speech_prob;
+  the whisper id is segment_index)
+- append only: every transcribed video lands in its own small part file (tmp + rename,
+  safe from several worker processes), `compact` merges parts into big sorted files
+- a re-transcribed video supersedes its older rows (latest written_at wins)
+- readers memory-map the files and filter by video_id on row group statistics
+  (the chapter scripts read it through divide_chapter/subtitle_source.py)
+- export : write the legacy csv/json files (same content as the old transcription output)
+
+Usage: python segment_store.py compact
+       python segment_store.py export --video-id abc123 --csv-dir out/csv
+"""
+import io
+import os
+import csv
+import json
+import time
+import uuid
+import argparse
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Config
+store_dir = "/data2/jiyoon/Pethroom/subtitles/segments"
+compact_row_group_rows = 64 * 1024
+
+schema = pa.schema([
+    ('video_id', pa.string()),
+    ('segment_index', pa.int32()),
+    ('start', pa.float64()),
+    ('end', pa.float64()),
+    ('text', pa.string()),
+    ('avg_logprob', pa.float32()),
+    ('no_speech_prob', pa.float32()),
+    ('written_at', pa.float64()),
+    ('seek', pa.int32()),
+    ('tokens', pa.list_(pa.int32())),
+    ('temperature', pa.float32()),
+    ('compression_ratio', pa.float32()),
+])
+
+# Field order of whisper's segment dicts, for the legacy json
+json_fields = ['id', 'seek', 'start', 'end', 'text', 'tokens', 'temperature',
+               'avg_logprob', 'compression_ratio', 'no_speech_prob']
+
+
+def segments_table(segments, video_id, written_at=None):
+    """Whisper segment dicts -> Arrow table (missing whisper fields become null)"""
+    written_at = time.time() if written_at is None else written_at
+    return pa.table({
+        'video_id': [video_id] * len(segments),
+        'segment_index': list(range(len(segments))),
+        'start': [seg['start'] for seg in segments],
+        'end': [seg['end'] for seg in segments],
+        'text': [seg['text'] for seg in segments],
+        'avg_logprob': [seg.get('avg_logprob') for seg in segments],
+        'no_speech_prob': [seg.get('no_speech_prob') for seg in segments],
+        'written_at': [written_at] * len(segments),
+        'seek': [seg.get('seek') for seg in segments],
+        'tokens': [list(seg['tokens']) if seg.get('tokens') is not None else None for seg in segments],
+        'temperature': [seg.get('temperature') for seg in segments],
+        'compression_ratio': [seg.get('compression_ratio') for seg in segments],
+    }, schema=schema)
+
+
+def part_files(root=store_dir):
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.join(root, f) for f in os.listdir(root) if f.endswith('.parquet'))
+
+
+def append_segments(segments, video_id, root=store_dir):
+    """Write one video as a new part file, return its path"""
+    os.makedirs(root, exist_ok=True)
+    name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+    path = os.path.join(root, name)
+    tmp_path = os.path.join(root, f".{name}.tmp")
+    pq.write_table(segments_table(segments, video_id), tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def latest_only(table):
+    """Drop rows of a video that were superseded by a later transcription"""
+    if table.num_rows == 0:
+        return table
+    latest = table.group_by('video_id').aggregate([('written_at', 'max')])
+    # index_in + take instead of a join, joins can't carry the tokens list column
+    latest_at = pc.take(latest['written_at_max'], pc.index_in(table['video_id'], latest['video_id']))
+    table = table.filter(pc.equal(table['written_at'], latest_at))
+    return table.sort_by([('video_id', 'ascending'), ('segment_index', 'ascending')])
+
+
+def read_table(video_ids=None, columns=None, root=store_dir):
+    """
+    Latest segments of the given videos (all videos if None), memory-mapped
+    columns : subset of schema names to return, e.g. ['start', 'end', 'text']
+    """
+    files = part_files(root)
+    if not files:
+        table = schema.empty_table()
+        return table if columns is None else table.select(columns)
+
+    needed = None
+    if columns is not None:
+        needed = [n for n in schema.names if n in set(columns) | {'video_id', 'segment_index', 'written_at'}]
+    filters = None if video_ids is None else [('video_id', 'in', list(video_ids))]
+    table = pq.read_table(files, columns=needed, filters=filters, memory_map=True, schema=schema)
+    table = latest_only(table)
+    return table if columns is None else table.select(columns)
+
+
+def read_video(video_id, root=store_dir, columns=('start', 'end', 'text')):
+    """Segments of one video as a pandas DataFrame, by default start, end, text (like the legacy CSV)"""
+    return read_table([video_id], list(columns), root).to_pandas()
+
+
+def video_info(root=store_dir):
+    """{video_id: {'rows', 'written_at', 'duration'}} of the latest transcription of every video"""
+    table = read_table(columns=['video_id', 'segment_index', 'end', 'written_at'], root=root)
+    if table.num_rows == 0:
+        return {}
+    stats = table.group_by('video_id').aggregate(
+        [('segment_index', 'count'), ('written_at', 'max'), ('end', 'max')]
+    ).to_pylist()
+    return {
+        row['video_id']: {'rows': row['segment_index_count'], 'written_at': row['written_at_max'],
+                          'duration': row['end_max']}
+        for row in stats
+    }
+
+
+def csv_text(rows):
+    """subtitle_<id>.csv content of (start, end, text) rows, exactly as export_legacy writes it"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["start", "end", "text"])
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def video_ids(root=store_dir):
+    files = part_files(root)
+    if not files:
+        return []
+    table = ds.dataset(files, schema=schema).to_table(columns=['video_id'])
+    return sorted(pc.unique(table['video_id']).to_pylist())
+
+
+def compact(root=store_dir):
+    """
+    Merge every part file into one file sorted by video_id, superseded rows dropped
+    Run it from a single process; writers may keep adding parts meanwhile
+    """
+    files = part_files(root)
+    if len(files) <= 1:
+        return 0
+    table = latest_only(ds.dataset(files, schema=schema).to_table())
+
+    name = f"part-{time.time_ns()}-compact.parquet"
+    tmp_path = os.path.join(root, f".{name}.tmp")
+    pq.write_table(table, tmp_path, row_group_size=compact_row_group_rows)
+    os.replace(tmp_path, os.path.join(root, name))
+    for path in files:
+        os.remove(path)
+    return len(files)
+
+
+def export_legacy(video_id, csv_dir=None, json_dir=None, root=store_dir, table=None):
+    """
+    Write subtitle_<id>.csv and/or subtitle_<id>.json from the store, return the paths
+    The json has every whisper field the store has (id = segment_index); fields a backend
+    didn't give, or rows written before they were stored, are left out
+    """
+    if table is None:
+        table = read_table([video_id], root=root)
+    rows = table.to_pylist()
+    paths = []
+
+    if csv_dir:
+        os.makedirs(csv_dir, exist_ok=True)
+        csv_path = os.path.join(csv_dir, f"subtitle_{video_id}.csv")
+        with open(csv_path, mode='w', newline='', encoding='utf-8') as f:
+            f.write(csv_text([seg['start'], seg['end'], seg['text']] for seg in rows))
+        paths.append(csv_path)
+
+    if json_dir:
+        os.makedirs(json_dir, exist_ok=True)
+        json_path = os.path.join(json_dir, f"subtitle_{video_id}.json")
+        segments = []
+        for seg in rows:
+            seg = dict(seg, id=seg['segment_index'])
+            segments.append({k: seg[k] for k in json_fields if seg.get(k) is not None})
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(segments, f, ensure_ascii=False)
+        paths.append(json_path)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whisper segment store maintenance")
+    parser.add_argument("command", choices=["compact", "export", "stats"])
+    parser.add_argument("--root", default=store_dir)
+    parser.add_argument("--video-id", action="append", help="export only these videos (repeatable)")
+    parser.add_argument("--csv-dir", help="write subtitle_<id>.csv here")
+    parser.add_argument("--json-dir", help="write subtitle_<id>.json here")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        print(f"✅ Merged {compact(args.root)} part files")
+    elif args.command == "export":
+        if not (args.csv_dir or args.json_dir):
+            parser.error("export needs --csv-dir and/or --json-dir")
+        ids = args.video_id or video_ids(args.root)
+        table = read_table(ids, root=args.root)
+        for video_id in ids:
+            rows = table.filter(pc.equal(table['video_id'], video_id))
+            export_legacy(video_id, args.csv_dir, args.json_dir, table=rows)
+        print(f"✅ Exported {len(ids)} videos")
+    else:
+        files = part_files(args.root)
+        rows = sum(pq.ParquetFile(f).metadata.num_rows for f in files)
+        print(f"{len(files)} part files, {rows} rows, {len(video_ids(args.root))} videos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Thin client for transcribe_server.py
+- input : video url or local audio path
+- output : segments printed, or saved to the segment store by the server (--save)
+"""
+
+import os
+import sys
+import json
+import argparse
+import urllib.request
+import urllib.error
+
+# --- Config ---
+server_url = "http://127.0.0.1:8765"
+
+
+def transcribe(target, save=False, url=server_url, timeout=3600):
+    """Send one job to the daemon and return its response dict"""
+    if target.startswith(('http://', 'https://')):
+        job = {'url': target}
+    else:
+        job = {'path': os.path.abspath(target)}
+    job['save'] = save
+
+    request = urllib.request.Request(
+        f"{url}/transcribe",
+        data=json.dumps(job).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a transcription job to the local daemon")
+    parser.add_argument("target", help="youtube url or local audio path")
+    parser.add_argument("--save", action="store_true", help="save segments on the server side")
+    parser.add_argument("--server", default=server_url)
+    args = parser.parse_args()
+
+    try:
+        result = transcribe(args.target, args.save, args.server)
+    except urllib.error.HTTPError as e:
+        print(f"❌ Error : {json.loads(e.read()).get('error', e)}")
+        sys.exit(1)
+    except urllib.error.URLError as e:
+        print(f"❌ Server not reachable at {args.server}: {e.reason}")
+        sys.exit(1)
+
+    if args.save:
+        print(f"✅ {result['video_id']} ({result['seconds']}s) saved: {', '.join(result['paths'])}")
+    else:
+        for seg in result['segments']:
+            print(f"[{seg['start']:.2f} - {seg['end']:.2f}] {seg['text']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Local transcription daemon that keeps one whisper model loaded
+- POST /transcribe {"url": ...} or {"path": ...}, optional "save": true
+  (segment store, plus csv/json with "export_legacy": true)
+- GET  /health
+Jobs run one at a time on the resident model; see transcribe_client.py
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import backends
+import manifest as mf
+import transcribe_videos as tv
+
+# --- Config ---
+host = "127.0.0.1"
+port = 8765
+
+
+class TranscriptionService:
+    """Resident backend plus a lock so jobs don't share the model"""
+
+    def __init__(self, spec, n_threads=None):
+        kind, name, compute = spec
+        print(f"Loading {backends.backend_label(*spec)} ...")
+        self.model = backends.load_backend(kind, name, n_threads, compute)
+        self.lock = threading.Lock()
+        self.jobs_done = 0
+        self.manifest = None
+
+    def transcribe(self, job):
+        """Run one job dict, return the response dict"""
+        video_url = job.get('url')
+        audio_path = job.get('path')
+        if not video_url and not audio_path:
+            raise ValueError("job needs 'url' or 'path'")
+
+        if video_url:
+            video_id = job.get('video_id') or tv.extract_video_id(video_url)
+            audio, _ = tv.fetch_audio(video_url, video_id, stream=job.get('stream', True))
+            if audio is None:
+                raise RuntimeError(f"Failed to download audio for {video_url}")
+        else:
+            video_id = job.get('video_id') or os.path.splitext(os.path.basename(audio_path))[0]
+            audio = tv.decode_audio(audio_path)
+
+        start = time.time()
+        with self.lock:
+            segments = self.model.transcribe(audio, language=job.get('language', 'ko'))
+            self.jobs_done += 1
+        tv.remove_audio(audio)
+
+        response = {
+            'video_id': video_id,
+            'seconds': round(time.time() - start, 2),
+            'segments': [{'start': s['start'], 'end': s['end'], 'text': s['text']} for s in segments],
+        }
+
+        if job.get('save'):
+            paths = tv.save_segments(segments, video_id, job.get('export_legacy', tv.export_legacy))
+            with self.lock:
+                if self.manifest is None:
+                    self.manifest = mf.Manifest(tv.manifest_path)
+            self.manifest.mark(video_id, mf.TRANSCRIBED, url=video_url, model=self.model.label)
+            response['paths'] = paths
+
+        return response
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok', 'model': service.model.label,
+                                     'jobs_done': service.jobs_done})
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/transcribe':
+                self.send_json(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                job = json.loads(self.rfile.read(length) or b'{}')
+                self.send_json(200, service.transcribe(job))
+            except (ValueError, RuntimeError) as e:
+                self.send_json(400, {'error': str(e)})
+            except Exception as e:
+                self.send_json(500, {'error': str(e)})
+
+        def log_message(self, fmt, *args):
+            print(f"[{self.log_date_time_string()}] {fmt % args}")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep a whisper model loaded and serve transcription jobs")
+    parser.add_argument("--host", default=host)
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=tv.backend)
+    parser.add_argument("--model", default=tv.model_name)
+    parser.add_argument("--compute-type", default=tv.compute_type)
+    parser.add_argument("--threads", type=int, default=None, help="torch / ctranslate2 threads")
+    args = parser.parse_args()
+
+    service = TranscriptionService((args.backend, args.model, args.compute_type), args.threads)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"✅ Listening on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if service.manifest is not None:
+            service.manifest.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,513 @@
 """
 Codes for transcribing youtube videos
 - input : txt file for channel urls
-- output : csv, json
+- output : whisper segments appended to the Parquet store in segment_store.py,
+  (long_form.py / short_form.py read it through subtitle_source.py),
+  subtitle_<id>.csv / .json only with --export-legacy
+
+Audio downloads run ahead of transcription in a small thread pool, so the
+network and Whisper work at the same time. With --workers N the videos are
+spread over N processes instead, each holding its own Whisper model.
+
+Progress is kept in a SQLite manifest next to csv_output_dir, so reruns only
+pick up new videos (and failed ones with --retry-failed).
+
+With --stream the audio never touches disk: yt-dlp pipes the best audio
+stream through ffmpeg into 16 kHz mono PCM, handed to Whisper as an array.
+
+With --chunk-workers N a single long video is cut at quiet points into
+chunks that N worker processes transcribe at once; the segments are stitched
+back with absolute timestamps, so the output format does not change.
+
+--backend picks the engine (openai-whisper or int8 faster-whisper), see
+backends.py; benchmark_backends.py compares them on local clips.
+
+Heavy modules (numpy, pyarrow, whisper, torch) are only imported once there is work to
+do. For one-off jobs keep a model resident with transcribe_server.py and send
+it work with transcribe_client.py.
 """
 
 import os
-import whisper
-import json
-import csv
 import time
+import queue
+import threading
+import argparse
 import subprocess
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+
+import manifest as mf
+import backends
 
-# Config 
-txt_file_path = "/data2/jiyoon/Pethroom/video_urls.txt"  
+# Config
+txt_file_path = "/data2/jiyoon/Pethroom/video_urls.txt"
 csv_output_dir = "/data2/jiyoon/Pethroom/subtitles/csv"
 json_output_dir = "/data2/jiyoon/Pethroom/subtitles/json"
+export_legacy = False                     # also write subtitle_<id>.csv / .json for tools outside the repo
+audio_tmp_dir = "/data2/jiyoon/Pethroom/subtitles/audio"
+manifest_path = os.path.join(os.path.dirname(csv_output_dir), "manifest.sqlite")
 
-os.makedirs(csv_output_dir, exist_ok=True)
-os.makedirs(json_output_dir, exist_ok=True)
+backend = "openai"                        # "openai" (openai-whisper) or "faster" (CTranslate2)
+model_name = "medium"
+compute_type = "int8"                     # faster-whisper weights
+download_workers = 2                      # parallel yt-dlp processes
+prefetch_depth = 3                        # audio files kept ready ahead of whisper
+max_prefetch_bytes = 2 * 1024 ** 3        # cap for downloaded, not yet transcribed audio (disk, or RAM with --stream)
+num_workers = 1                           # >1 switches to one whisper model per process
+threads_per_worker = 4                    # torch threads inside each worker process
+chunk_workers = 1                         # >1 splits each long video across processes
+chunk_sec = 300                           # target chunk length for --chunk-workers
+chunk_overlap_sec = 2.0                   # audio shared by neighbouring chunks
 
+# Approximate resident memory of one fp32 whisper model on CPU (GB)
+model_ram_gb = {"tiny": 1, "base": 1, "small": 2, "medium": 5, "large": 10, "turbo": 6}
+compute_ram_factor = {"int8": 0.35, "int8_float32": 0.35, "float16": 0.5}
 
-# Load Whisper
-model = whisper.load_model("medium")
+user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+ytdlp_options = [
+    '--user-agent', user_agent,
+    '--add-header', 'Accept-Language:en-US,en;q=0.9',
+    '--add-header', 'Accept:text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    '--extractor-retries', '3', '--fragment-retries', '3',
+]
+SAMPLE_RATE = 16000  # whisper input rate
 
-# Read URLs from file
-with open(txt_file_path, 'r', encoding='utf-8') as f:
-    video_urls = [line.strip() for line in f if line.strip()]
 
-print(f"Found {len(video_urls)} videos to process")
-
-
-
-for i, video_url in enumerate(video_urls, 1):
-    print(f"\n--- Processing video {i}/{len(video_urls)} ---")
-    print(f"URL: {video_url}")
-    
-    # Extract video ID for filename
+# --- Utils ---
+def extract_video_id(video_url):
+    """Extract video ID for filename"""
     if 'watch?v=' in video_url:
-        video_id = video_url.split('watch?v=')[1].split('&')[0]
+        return video_url.split('watch?v=')[1].split('&')[0]
     elif 'shorts/' in video_url:
-        video_id = video_url.split('shorts/')[1].split('?')[0]
+        return video_url.split('shorts/')[1].split('?')[0]
     else:
-        video_id = video_url.split('/')[-1].split('?')[0]
-    
-    audio_path = f"video_{video_id}.mp3"
-    csv_path = os.path.join(csv_output_dir, f"subtitle_{video_id}.csv")
-    json_path = os.path.join(json_output_dir, f"subtitle_{video_id}.json")
-    
+        return video_url.split('/')[-1].split('?')[0]
+
+
+def download_audio(video_url, video_id):
+    """
+    Download mp3 using yt-dlp with user agent to avoid 403 errors
+    Returns the audio path, or None if the download failed
+    """
+    audio_path = os.path.join(audio_tmp_dir, f"video_{video_id}.mp3")
+    command = [
+        'yt-dlp', '-x', '--audio-format', 'mp3', *ytdlp_options,
+        '-o', os.path.join(audio_tmp_dir, f"video_{video_id}.%(ext)s"),
+        video_url,
+    ]
+    subprocess.run(command, capture_output=True, text=True)
+
+    if not os.path.exists(audio_path):
+        return None
+    return audio_path
+
+
+def stream_audio(video_url):
+    """
+    Pipe the best audio stream from yt-dlp through ffmpeg into memory
+    Returns 16 kHz mono float32 samples, or None if nothing was decoded
+    """
+    import numpy as np
+
+    ytdlp = subprocess.Popen(
+        ['yt-dlp', '-f', 'bestaudio/best', '--quiet', *ytdlp_options, '-o', '-', video_url],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    ffmpeg = subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', 'pipe:0',
+         '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1'],
+        stdin=ytdlp.stdout, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    ytdlp.stdout.close()  # ffmpeg owns the pipe now
+    pcm, _ = ffmpeg.communicate()
+    ytdlp.wait()
+
+    if ytdlp.returncode != 0 or ffmpeg.returncode != 0 or not pcm:
+        return None
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio(audio_path):
+    """Read an audio file as 16 kHz mono float32 samples"""
+    import numpy as np
+
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-i', audio_path,
+        '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1',
+    ]
+    pcm = subprocess.run(command, capture_output=True, check=True).stdout
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def fetch_audio(video_url, video_id, stream=False):
+    """
+    Get whisper input for one video
+    Returns (mp3 path or float32 samples, size in bytes), audio is None on failure
+    """
+    if stream:
+        audio = stream_audio(video_url)
+        return audio, (audio.nbytes if audio is not None else 0)
+
+    audio_path = download_audio(video_url, video_id)
+    return audio_path, (os.path.getsize(audio_path) if audio_path else 0)
+
+
+def save_segments(segments, video_id, legacy=False):
+    """
+    Append whisper segments to the segment store
+    With legacy, also write subtitle_<id>.csv and .json; returns every path written
+    """
+    import segment_store
+
+    paths = [segment_store.append_segments(segments, video_id)]
+    if legacy:
+        paths += segment_store.export_legacy(
+            video_id, csv_output_dir, json_output_dir, table=segment_store.segments_table(segments, video_id)
+        )
+    return paths
+
+
+def remove_audio(audio_path):
+    """Clean up audio file to save space (streamed arrays need nothing)"""
+    if isinstance(audio_path, str) and os.path.exists(audio_path):
+        os.remove(audio_path)
+        print(f"🗑️ Cleaned up {audio_path}")
+
+
+class DiskBudget:
+    """
+    Track bytes of downloaded audio waiting for whisper (file or in-memory)
+    New downloads are held back while the budget is used up
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def wait_for_room(self):
+        with self.cond:
+            while self.used >= self.max_bytes:
+                self.cond.wait()
+
+    def add(self, n_bytes):
+        with self.cond:
+            self.used += n_bytes
+
+    def release(self, n_bytes):
+        with self.cond:
+            self.used -= n_bytes
+            self.cond.notify_all()
+
+
+def select_pending(video_urls, manifest, label, retry_failed=False, force_model=False):
+    """
+    Drop videos the manifest says are done
+    - transcribed : skipped, unless --force-model and it was made with another model
+    - failed : skipped, unless --retry-failed
+    Subtitles from before the manifest existed are registered as transcribed with the
+    original openai-whisper medium model (rows adopted without a model count as that too)
+    """
+    legacy_label = backends.backend_label("openai", "medium")
+    pending = []
+    for video_url in video_urls:
+        video_id = extract_video_id(video_url)
+        entry = manifest.get(video_id)
+
+        if entry is None:
+            csv_path = os.path.join(csv_output_dir, f"subtitle_{video_id}.csv")
+            if os.path.exists(csv_path):
+                manifest.mark(video_id, mf.TRANSCRIBED, url=video_url, model=legacy_label)
+                entry = manifest.get(video_id)
+
+        if entry is None or entry['state'] == mf.DOWNLOADED:
+            pending.append(video_url)
+        elif entry['state'] == mf.FAILED:
+            if retry_failed:
+                pending.append(video_url)
+        elif entry['state'] == mf.TRANSCRIBED:
+            if force_model and (entry['model'] or legacy_label) != label:
+                pending.append(video_url)
+
+    return pending
+
+
+def prefetch_audio(video_urls, executor, ready_queue, budget, manifest, stream=False):
+    """
+    Producer: start downloads in url order and hand their futures to whisper
+    ready_queue is bounded, so at most prefetch_depth files wait for whisper
+    """
+
+    def fetch(video_url):
+        video_id = extract_video_id(video_url)
+        audio, size = fetch_audio(video_url, video_id, stream)
+        budget.add(size)
+        if audio is not None:
+            manifest.mark(video_id, mf.DOWNLOADED, url=video_url)
+        return video_id, audio, size
+
+    for video_url in video_urls:
+        budget.wait_for_room()
+        ready_queue.put((video_url, executor.submit(fetch, video_url)))
+
+    ready_queue.put(None)
+
+
+def transcribe_chunked(chunk_pool, audio):
+    """Transcribe one video as parallel chunks and stitch the segments"""
+    import chunked
+
+    if isinstance(audio, str):
+        audio = decode_audio(audio)
+
+    splits = chunked.find_split_points(audio, chunk_sec)
+    chunks = chunked.make_chunks(audio, splits, chunk_overlap_sec)
+    print(f"Split into {len(chunks)} chunks")
+
+    results = chunk_pool.map(transcribe_chunk_in_worker, [(offset, samples) for offset, _, samples in chunks])
+    return chunked.stitch_segments([(own_end, segs) for (_, own_end, _), segs in zip(chunks, results)])
+
+
+def run_pipeline(video_urls, spec, manifest, stream=False, chunk_pool=None, legacy=False):
+    """
+    Single whisper model, downloads prefetched in background threads
+    With chunk_pool, the models live in the pool and each video is chunked
+    spec is (backend, model name, compute type)
+    """
+    # Load Whisper
+    model = backends.load_backend(*spec[:2], compute_type=spec[2]) if chunk_pool is None else None
+    label = backends.backend_label(*spec)
+
+    budget = DiskBudget(max_prefetch_bytes)
+    ready_queue = queue.Queue(maxsize=prefetch_depth)
+
+    with ThreadPoolExecutor(max_workers=download_workers) as executor:
+        producer = threading.Thread(
+            target=prefetch_audio,
+            args=(video_urls, executor, ready_queue, budget, manifest, stream),
+            daemon=True,
+        )
+        producer.start()
+
+        i = 0
+        while True:
+            item = ready_queue.get()
+            if item is None:
+                break
+            video_url, future = item
+            i += 1
+
+            print(f"\n--- Processing video {i}/{len(video_urls)} ---")
+            print(f"URL: {video_url}")
+
+            video_id = extract_video_id(video_url)
+            audio, size = None, 0
+            try:
+                video_id, audio, size = future.result()
+
+                if audio is None:
+                    print(f"❌ Failed to download audio for {video_url}")
+                    manifest.mark(video_id, mf.FAILED, url=video_url, error="download failed")
+                    continue
+
+                # Whisper transcription
+                print("Transcribing...")
+                if chunk_pool is None:
+                    segments = model.transcribe(audio, language="ko")
+                else:
+                    segments = transcribe_chunked(chunk_pool, audio)
+                paths = save_segments(segments, video_id, legacy)
+                manifest.mark(video_id, mf.TRANSCRIBED, url=video_url, model=label)
+
+                print(f"✅ Successfully processed! Saved: {', '.join(paths)}")
+
+            except Exception as e:
+                print(f"❌ Error processing {video_url}: {str(e)}")
+                manifest.mark(video_id, mf.FAILED, url=video_url, error=str(e))
+                continue
+
+            finally:
+                remove_audio(audio)
+                budget.release(size)
+
+        producer.join()
+
+
+# --- Process pool ---
+worker_model = None
+worker_stream = False
+worker_legacy = False
+
+
+def available_ram_gb():
+    """MemAvailable from /proc/meminfo, None if it can't be read"""
     try:
-        # Download mp3 using yt-dlp with user agent to avoid 403 errors
-        print("Downloading audio...")
-        os.system(f'yt-dlp -x --audio-format mp3 --user-agent "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36" --add-header "Accept-Language:en-US,en;q=0.9" --add-header "Accept:text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8" --extractor-retries 3 --fragment-retries 3 -o "video_{video_id}.%(ext)s" "{video_url}"')
-        
-        if not os.path.exists(audio_path):
-            print(f"❌ Failed to download audio for {video_url}")
-            continue
-        
-        # Whisper transcription
-        print("Transcribing...")
-        result = model.transcribe(audio_path, language="ko", word_timestamps=False)
-        segments = result['segments']
-        
-        # Save CSV
-        with open(csv_path, mode='w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(["start", "end", "text"])
-            for seg in segments:
-                writer.writerow([seg['start'], seg['end'], seg['text']])
-        
-        # Save JSON
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(segments, f, ensure_ascii=False, indent=2)
-        
-        print(f"✅ Successfully processed! CSV: {csv_path}, JSON: {json_path}")
-        
-        # Clean up audio file to save space
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-            print(f"🗑️ Cleaned up {audio_path}")
-            
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024 ** 2
+    except OSError:
+        pass
+    return None
+
+
+def max_workers_for_ram(spec):
+    """How many copies of the model fit in available memory"""
+    ram = available_ram_gb()
+    if ram is None:
+        return None
+    kind, name, compute = spec
+    per_model = model_ram_gb.get(name.split('.')[0].split('-')[0], model_ram_gb["large"])
+    if kind == "faster":
+        per_model *= compute_ram_factor.get(compute, 1)
+    return max(int(ram // per_model), 0)
+
+
+def fits_in_ram(spec, workers):
+    limit = max_workers_for_ram(spec)
+    if limit is not None and workers > limit:
+        print(f"❌ {workers} workers x '{backends.backend_label(*spec)}' won't fit in RAM (room for {limit})")
+        return False
+    return True
+
+
+def init_worker(spec, n_threads, stream=False, legacy=False):
+    """Load whisper once per worker process"""
+    global worker_model, worker_stream, worker_legacy
+    kind, name, compute = spec
+    worker_model = backends.load_backend(kind, name, n_threads, compute)
+    worker_stream = stream
+    worker_legacy = legacy
+
+
+def transcribe_in_worker(video_url):
+    """Download + transcribe one video inside a pool worker"""
+    video_id = extract_video_id(video_url)
+    audio = None
+    try:
+        audio, _ = fetch_audio(video_url, video_id, worker_stream)
+        if audio is None:
+            return video_url, video_id, False, "download failed"
+
+        save_segments(worker_model.transcribe(audio, language="ko"), video_id, worker_legacy)
+        return video_url, video_id, True, None
+
     except Exception as e:
-        print(f"❌ Error processing {video_url}: {str(e)}")
-        continue
+        return video_url, video_id, False, str(e)
+
+    finally:
+        if isinstance(audio, str) and os.path.exists(audio):
+            os.remove(audio)
+
+
+def transcribe_chunk_in_worker(chunk):
+    """Transcribe one (offset_sec, samples) chunk, segments in absolute time"""
+    import chunked
+
+    offset_sec, samples = chunk
+    segments = worker_model.transcribe(samples, language="ko")
+    return chunked.shift_segments(segments, offset_sec)
+
+
+def run_chunked(video_urls, spec, workers, n_threads, manifest, stream=False, legacy=False):
+    """Videos one after another, each split across a pool of whisper processes"""
+    if not fits_in_ram(spec, workers):
+        return False
+
+    print(f"Starting {workers} chunk workers x {n_threads} threads ('{backends.backend_label(*spec)}')")
+
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers, initializer=init_worker, initargs=(spec, n_threads)) as pool:
+        run_pipeline(video_urls, spec, manifest, stream, chunk_pool=pool, legacy=legacy)
+    return True
+
+
+def run_pool(video_urls, spec, workers, n_threads, manifest, stream=False, legacy=False):
+    """One whisper model per process, videos pulled from a shared task queue"""
+    if not fits_in_ram(spec, workers):
+        return False
+
+    label = backends.backend_label(*spec)
+    print(f"Starting {workers} workers x {n_threads} threads ('{label}')")
+
+    ctx = mp.get_context("spawn")
+    success_count = 0
+    with ctx.Pool(workers, initializer=init_worker, initargs=(spec, n_threads, stream, legacy)) as pool:
+        results = pool.imap_unordered(transcribe_in_worker, video_urls)
+        for i, (video_url, video_id, ok, error) in enumerate(results, 1):
+            if ok:
+                success_count += 1
+                manifest.mark(video_id, mf.TRANSCRIBED, url=video_url, model=label)
+                print(f"✅ [{i}/{len(video_urls)}] {video_url}")
+            else:
+                manifest.mark(video_id, mf.FAILED, url=video_url, error=error)
+                print(f"❌ [{i}/{len(video_urls)}] {video_url}: {error}")
+
+    print(f"✅ Processing complete: {success_count}/{len(video_urls)} videos transcribed")
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Transcribe youtube videos with whisper")
+    parser.add_argument("--workers", type=int, default=num_workers,
+                        help="number of whisper processes (1 = single model with download prefetch)")
+    parser.add_argument("--threads-per-worker", type=int, default=threads_per_worker,
+                        help="torch threads inside each worker process")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backend,
+                        help="transcription engine")
+    parser.add_argument("--model", default=model_name,
+                        help="whisper model name")
+    parser.add_argument("--compute-type", default=compute_type,
+                        help="faster-whisper quantization (int8, int8_float32, float32)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="re-process videos the manifest marks as failed")
+    parser.add_argument("--force-model", action="store_true",
+                        help="re-transcribe videos made with a different backend/model than the current one")
+    parser.add_argument("--stream", action="store_true",
+                        help="pipe audio yt-dlp -> ffmpeg -> whisper in memory, no temp mp3 files")
+    parser.add_argument("--chunk-workers", type=int, default=chunk_workers,
+                        help="split each long video into chunks transcribed by N processes")
+    parser.add_argument("--export-legacy", action=argparse.BooleanOptionalAction, default=export_legacy,
+                        help="also write subtitle_<id>.csv and .json for each video")
+    return parser.parse_args()
+
+
+def main():
+    """Transcribe every url in txt_file_path"""
+    args = parse_args()
+
+    os.makedirs(audio_tmp_dir, exist_ok=True)
+
+    # Read URLs from file
+    with open(txt_file_path, 'r', encoding='utf-8') as f:
+        video_urls = [line.strip() for line in f if line.strip()]
+
+    manifest = mf.Manifest(manifest_path)
+    spec = (args.backend, args.model, args.compute_type)
+    pending = select_pending(video_urls, manifest, backends.backend_label(*spec),
+                             args.retry_failed, args.force_model)
+
+    print(f"Found {len(video_urls)} videos, {len(pending)} remaining to process")
+    if not pending:
+        print("✅ All videos have already been transcribed!")
+        manifest.close()
+        return
+
+    start = time.time()
+
+    if args.chunk_workers > 1:
+        run_chunked(pending, spec, args.chunk_workers, args.threads_per_worker, manifest, args.stream,
+                    args.export_legacy)
+    elif args.workers > 1:
+        run_pool(pending, spec, args.workers, args.threads_per_worker, manifest, args.stream, args.export_legacy)
+    else:
+        run_pipeline(pending, spec, manifest, args.stream, legacy=args.export_legacy)
+
+    print(f"Manifest: {manifest.counts()}")
+    manifest.close()
+
+    print(f"\n🎉 All videos processed! ({time.time() - start:.1f}s)")
+
 
-print("\n🎉 All videos processed!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()